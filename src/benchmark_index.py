@@ -0,0 +1,139 @@
+import argparse
+import logging
+import time
+
+import numpy as np
+from pymilvus import MilvusClient
+
+from embedding import EmbeddingModel
+from settings import Settings
+from utils import DEFAULT_EVAL_FILE, DEFAULT_SAVE_FILE, load_json, save_json
+from vector_db import BINARY_INDEX_TYPES, INDEX_PROFILES, VECTOR_DTYPES, IndexProfile, VectorDB
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_BENCHMARK_FILE = "./data/index_benchmark.json"
+
+BITS_PER_DIMENSION = {"float32": 32, "float16": 16, "bfloat16": 16, "binary": 1}
+
+
+def estimate_index_memory(
+    profile: IndexProfile,
+    num_vectors: int,
+    dimension: int,
+    vector_dtype: str = "float32",
+) -> int:
+    """Rough in-memory footprint of the vector index in bytes, following Milvus' sizing guidelines."""
+    raw = num_vectors * dimension * BITS_PER_DIMENSION[vector_dtype] // 8
+    params = profile.build_params(dimension)
+    if profile.index_type == "HNSW":
+        return raw + num_vectors * params["M"] * 2 * 4
+    if profile.index_type == "IVF_PQ":
+        codes = num_vectors * params["m"] * params["nbits"] // 8
+        return codes + params["nlist"] * dimension * 4
+    if profile.index_type == "DISKANN":
+        # Only the PQ codes stay in memory; Milvus sizes them at 12.5% of the raw vectors by default.
+        return raw // 8
+    return raw
+
+
+def wait_for_index(milvus_client: MilvusClient, collection_name: str, timeout: float = 3600.0) -> None:
+    milvus_client.flush(collection_name)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        index = milvus_client.describe_index(collection_name, index_name="vector")
+        if index.get("pending_index_rows", 0) == 0 and index.get("state", "Finished") == "Finished":
+            break
+        time.sleep(1.0)
+    milvus_client.release_collection(collection_name)
+    milvus_client.load_collection(collection_name)
+
+
+def benchmark_profile(
+    vector_db: VectorDB,
+    query_vectors: np.ndarray,
+    top_k: int,
+) -> tuple[list[list[int]], list[float]]:
+    ids, latencies = [], []
+    for vector in query_vectors:
+        start_time = time.perf_counter()
+        hits = vector_db._search([vector], top_k)[0]
+        latencies.append(time.perf_counter() - start_time)
+        ids.append([hit.id for hit in hits])
+    return ids, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Milvus index profiles on the scraped corpus.")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(INDEX_PROFILES), default=sorted(INDEX_PROFILES))
+    parser.add_argument("--vector-dtypes", nargs="+", choices=list(VECTOR_DTYPES), default=["float32"])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark collections after the run")
+    args = parser.parse_args()
+
+    settings = Settings()
+    data = load_json(DEFAULT_SAVE_FILE)
+    questions = [item["question"] for item in load_json(DEFAULT_EVAL_FILE)]
+    embedding_model = EmbeddingModel(
+        settings.embedding_model,
+        batch_size=settings.embedding_batch_size,
+        cache_dir=settings.embedding_cache_dir,
+    )
+    milvus_client = MilvusClient(uri=settings.milvus_uri, token=settings.milvus_token)
+    query_vectors = embedding_model.encode_queries(questions)
+
+    # Brute force float32 search is the ground truth every other configuration is measured against.
+    profiles = ["flat"] + [profile for profile in args.profiles if profile != "flat"]
+    vector_dtypes = ["float32"] + [vector_dtype for vector_dtype in args.vector_dtypes if vector_dtype != "float32"]
+    configurations = [
+        (profile, vector_dtype)
+        for profile in profiles
+        for vector_dtype in vector_dtypes
+        if vector_dtype != "binary" or INDEX_PROFILES[profile].index_type in BINARY_INDEX_TYPES
+    ]
+    reference_ids = None
+    report = {}
+    for profile, vector_dtype in configurations:
+        vector_db = VectorDB(
+            embedding_model=embedding_model,
+            milvus_client=milvus_client,
+            result_cache_size=0,
+            index_profile=profile,
+            collection_name=f"laws_bench_{profile}_{vector_dtype}",
+            vector_dtype=vector_dtype,
+        )
+        logger.info(f"Building {profile} index over {vector_dtype} vectors")
+        start_time = time.time()
+        vector_db.create_collection_from_documents(documents=data, drop_existing=True)
+        wait_for_index(milvus_client, vector_db.collection_name)
+        build_time = time.time() - start_time
+
+        ids, latencies = benchmark_profile(vector_db, query_vectors, args.top_k)
+        if reference_ids is None:
+            reference_ids = ids
+        recall = np.mean(
+            [len(set(found) & set(expected)) / max(1, len(expected)) for found, expected in zip(ids, reference_ids)]
+        )
+        num_vectors = milvus_client.get_collection_stats(vector_db.collection_name)["row_count"]
+        report[f"{profile}/{vector_dtype}"] = {
+            f"recall@{args.top_k}": float(recall),
+            "p50_latency_ms": float(np.percentile(latencies, 50) * 1000),
+            "p99_latency_ms": float(np.percentile(latencies, 99) * 1000),
+            "estimated_index_memory_mb": estimate_index_memory(
+                INDEX_PROFILES[profile], num_vectors, embedding_model.dimension, vector_dtype
+            )
+            / 2**20,
+            "build_time_s": build_time,
+        }
+        if not args.keep:
+            vector_db.drop_collection()
+
+    save_json(report, DEFAULT_INDEX_BENCHMARK_FILE)
+    print(f"\n=== Index profiles ({len(questions)} queries, top_k={args.top_k}) ===")
+    for configuration, metrics in report.items():
+        print(f"{configuration}: " + ", ".join(f"{key}={value:.3f}" for key, value in metrics.items()))
+
+
+if __name__ == "__main__":
+    main()
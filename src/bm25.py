@@ -0,0 +1,88 @@
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from collections.abc import Iterable
+from pathlib import Path
+
+# Keeps identifiers such as "2024/1244" or "166/2006" together, since legal queries often hinge on them.
+TOKEN_PATTERN = re.compile(r"\w+(?:[./-]\w+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def bm25_scores(query: str, texts: list[str], k1: float = 1.5, b: float = 0.75) -> list[float]:
+    """Score texts against a query with BM25, taking document frequencies from the given texts only."""
+    documents = [Counter(tokenize(text)) for text in texts]
+    if not documents:
+        return []
+    lengths = [sum(document.values()) for document in documents]
+    avg_length = sum(lengths) / len(lengths) or 1.0
+    query_terms = set(tokenize(query))
+    document_frequency = {term: sum(1 for document in documents if term in document) for term in query_terms}
+
+    scores = []
+    for document, length in zip(documents, lengths):
+        score = 0.0
+        for term in query_terms:
+            frequency = document.get(term, 0)
+            if not frequency:
+                continue
+            df = document_frequency[term]
+            idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+            score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / avg_length))
+        scores.append(score)
+    return scores
+
+
+class BM25Index:
+    """Persistent lexical index over section names and texts, backed by SQLite FTS5 and keyed by section id."""
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS sections USING fts5(name, text)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+
+    def ids(self) -> set[int]:
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT rowid FROM sections")}
+
+    def add_many(self, sections: Iterable[dict]) -> None:
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO sections (rowid, name, text) VALUES (?, ?, ?)",
+                ((section["id"], section["name"], section["text"]) for section in sections),
+            )
+            self._db.commit()
+
+    def remove_many(self, ids: list[int]) -> None:
+        with self._lock:
+            self._db.executemany("DELETE FROM sections WHERE rowid = ?", ((id,) for id in ids))
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM sections")
+            self._db.commit()
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[int, float]]:
+        # Quoting makes FTS5 match an identifier like "2024/1244" as a phrase of its adjacent tokens.
+        terms = [f'"{term}"' for term in set(tokenize(query))]
+        if not terms:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT rowid, bm25(sections) FROM sections WHERE sections MATCH ? ORDER BY bm25(sections) LIMIT ?",
+                (" OR ".join(terms), limit),
+            ).fetchall()
+        # FTS5 reports BM25 as a negative number where lower is better.
+        return [(id, -score) for id, score in rows]
@@ -0,0 +1,265 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock; there the cache is safe for a single writing process only.
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with an optional time-to-live and hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+class EmbeddingCache:
+    """Append-only on-disk store of float32 embeddings keyed by a digest of the embedded text.
+
+    Several processes may share one cache directory. Appends hold an exclusive lock on the directory's lock file
+    and first catch up with rows other writers added, so a new row's number is always its offset in the file.
+    """
+
+    _KEY_SIZE = 16
+
+    def __init__(self, cache_dir: str, model_name: str, dimension: int) -> None:
+        self.path = Path(cache_dir) / re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dimension = dimension
+        self._vectors_path = self.path / "vectors.f32"
+        self._keys_path = self.path / "keys.bin"
+        self._lock_path = self.path / "lock"
+        self._row_size = dimension * np.dtype(np.float32).itemsize
+        self._index: dict[bytes, int] = {}
+        self._rows = 0
+        self._matrix: np.memmap | None = None
+        self._lock = threading.Lock()
+        with self._file_lock():
+            self._sync()
+        logger.info(f"Loaded {self._rows} cached embeddings from {self.path}")
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_many(self, digests: list[bytes]) -> tuple[np.ndarray, list[int]]:
+        if any(digest not in self._index for digest in digests):
+            # Other processes may have embedded these texts since this instance last looked.
+            with self._file_lock():
+                self._sync()
+        vectors = np.empty((len(digests), self.dimension), dtype=np.float32)
+        rows = [self._index.get(digest) for digest in digests]
+        hits = [i for i, row in enumerate(rows) if row is not None]
+        if hits:
+            vectors[hits] = self._get_matrix()[[rows[i] for i in hits]]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        return vectors, missing
+
+    def put_many(self, digests: list[bytes], vectors: np.ndarray) -> None:
+        with self._file_lock():
+            self._sync()
+            self._append(digests, vectors)
+
+    def _append(self, digests: list[bytes], vectors: np.ndarray) -> None:
+        new_rows: dict[bytes, np.ndarray] = {}
+        for digest, vector in zip(digests, vectors):
+            if digest not in self._index:
+                new_rows.setdefault(digest, vector)
+        if not new_rows:
+            return
+        # Vectors are written before keys, so a crash between the two writes leaves orphan rows that
+        # _sync trims instead of keys pointing at missing vectors. The index is only extended once both
+        # files hold the new rows, so concurrent readers never see a key without its vector.
+        with open(self._vectors_path, "ab") as f:
+            f.write(np.asarray(list(new_rows.values()), dtype=np.float32).tobytes())
+        with open(self._keys_path, "ab") as f:
+            f.write(b"".join(new_rows))
+        start = self._rows
+        self._rows += len(new_rows)
+        for row, digest in enumerate(new_rows, start):
+            self._index[digest] = row
+
+    def _sync(self) -> None:
+        """Trim rows left by an interrupted append and index the rows written since the last sync.
+
+        Must be called with the file lock held, since trimming would otherwise race another writer's append.
+        """
+        keys_size = self._keys_path.stat().st_size if self._keys_path.exists() else 0
+        vectors_size = self._vectors_path.stat().st_size if self._vectors_path.exists() else 0
+        rows = min(keys_size // self._KEY_SIZE, vectors_size // self._row_size)
+        if keys_size != rows * self._KEY_SIZE or vectors_size != rows * self._row_size:
+            logger.warning(f"Trimming embedding cache at {self.path} to {rows} consistent rows")
+            for path, size in ((self._keys_path, rows * self._KEY_SIZE), (self._vectors_path, rows * self._row_size)):
+                if path.exists():
+                    os.truncate(path, size)
+        if rows <= self._rows:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._rows * self._KEY_SIZE)
+            keys = f.read((rows - self._rows) * self._KEY_SIZE)
+        for row in range(self._rows, rows):
+            offset = (row - self._rows) * self._KEY_SIZE
+            self._index.setdefault(keys[offset : offset + self._KEY_SIZE], row)
+        self._rows = rows
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        # The thread lock comes first: flock is held per open file, so threads of one process would not
+        # exclude each other through it.
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _get_matrix(self) -> np.memmap:
+        # Rows are only ever appended, so a map that covers every indexed row stays valid.
+        if self._matrix is None or len(self._matrix) < self._rows:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dimension))
+        return self._matrix
+
+
+class ScoreCache:
+    """Reranker scores keyed by (scorer, query digest, primary key): an LRU tier backed by an optional SQLite file."""
+
+    def __init__(self, namespace: str, maxsize: int = 100_000, db_path: str | None = None) -> None:
+        self.namespace = namespace
+        self.memory = LRUCache(maxsize=maxsize)
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "namespace TEXT, query BLOB, id INTEGER, score REAL, PRIMARY KEY (namespace, query, id))"
+            )
+            self._db.commit()
+
+    def get_many(self, query: str, ids: list[int]) -> dict[int, float]:
+        query_key = text_digest(query)
+        found = {}
+        for id in ids:
+            score = self.memory.get((query_key, id))
+            if score is not None:
+                found[id] = score
+
+        missing = [id for id in ids if id not in found]
+        if missing and self._db is not None:
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT id, score FROM scores WHERE namespace = ? AND query = ? "
+                    f"AND id IN ({', '.join('?' * len(missing))})",
+                    (self.namespace, query_key, *missing),
+                ).fetchall()
+            for id, score in rows:
+                found[id] = score
+                self.memory.put((query_key, id), score)
+        return found
+
+    def put_many(self, query: str, scores: dict[int, float]) -> None:
+        query_key = text_digest(query)
+        for id, score in scores.items():
+            self.memory.put((query_key, id), score)
+        if scores and self._db is not None:
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO scores (namespace, query, id, score) VALUES (?, ?, ?, ?)",
+                    [(self.namespace, query_key, id, score) for id, score in scores.items()],
+                )
+                self._db.commit()
+
+
+class ResponseCache:
+    """LLM completions stored in SQLite and keyed by (model, prompt digest), so reruns only pay for changed prompts."""
+
+    def __init__(self, db_path: str) -> None:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (model TEXT, prompt BLOB, response TEXT, PRIMARY KEY (model, prompt))"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, prompt: str) -> str | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE model = ? AND prompt = ?", (model, text_digest(prompt))
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, model: str, prompt: str, response: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (model, prompt, response) VALUES (?, ?, ?)",
+                (model, text_digest(prompt), response),
+            )
+            self._db.commit()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "size": size}
@@ -3,12 +3,15 @@ import logging
 import time
 
 from openai import AsyncOpenAI
+from tqdm.auto import tqdm
 
+from cache import ResponseCache
 from cross_encoder import CrossEncoder
 from evaluation import call_llm
 from law_assistant import LawAssistant
 from prompts import EVALUATION_PROMPT
-from vector_db import VectorDB
+from rate_limit import RateLimiter, limiter_wait
+from vector_db import Hit, VectorDB, resolve_payloads
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,6 +25,8 @@ class RAGComparison:
         cross_encoder: CrossEncoder,
         dataset: list[dict[str, str]],
         model_name: str = "gpt-4.1-nano-2025-04-14",
+        limiter: RateLimiter | None = None,
+        response_cache: ResponseCache | None = None,
     ):
         self.vector_db = vector_db
         self.assistant = LawAssistant(
@@ -29,10 +34,15 @@ class RAGComparison:
             openai_client=openai_client,
             cross_encoder=cross_encoder,
             model_name=model_name,
+            limiter=limiter,
+            response_cache=response_cache,
         )
         self.dataset = dataset
         self.openai_client = openai_client
         self.model_name = model_name
+        # Shared by the assistant and the judge, so both draw from the same request and token budget.
+        self.limiter = limiter
+        self.response_cache = response_cache
 
     async def __call__(self, top_k: int = 10) -> dict:
         with_reranker_score, with_reranker_time = await self._evaluate_retrieval_method(use_reranker=True, top_k=top_k)
@@ -51,30 +61,50 @@ class RAGComparison:
             },
         }
 
-    async def _evaluate_retrieval_method(self, use_reranker: bool, top_k: int = 10) -> tuple[float, float]:
-        total_time = 0.0
-        total_score = 0
-        responses = []
-        for item in self.dataset:
-            start_time = time.time()
-            response = await self.assistant.generate_response(item["question"], use_reranker=use_reranker, top_k=top_k)
-            responses.append(response)
-            total_time += time.time() - start_time
-
-        scoring_tasks = [
-            self._evaluate_with_llm_as_judge(item["question"], response, item["answer"])
-            for item, response in zip(self.dataset, responses)
-        ]
+    async def _evaluate_retrieval_method(
+        self, use_reranker: bool, top_k: int = 10, multiplier: int = 2
+    ) -> tuple[float, float]:
+        questions = [item["question"] for item in self.dataset]
+        start_time = time.time()
+        search_width = top_k * multiplier if use_reranker else top_k
+        hits_per_item = self.vector_db.search_many(questions, limit=search_width)
+        # Reranking is synchronous, so it runs as one batch before the LLM calls. Inside the gathered tasks it would
+        # block the event loop and be counted in the latency of every item already waiting on the model.
+        if use_reranker:
+            hits_per_item = self.assistant.rerank_many(questions, hits_per_item, top_k)
+        retrieval_time = time.time() - start_time
 
-        scoring_results = await asyncio.gather(*scoring_tasks, return_exceptions=True)
+        with tqdm(total=len(self.dataset), desc="Evaluating RAG", unit="question") as pbar:
+            results = await asyncio.gather(
+                *[self._evaluate_item(item, hits, top_k, pbar) for item, hits in zip(self.dataset, hits_per_item)]
+            )
+        total_score = sum(score for score, _ in results)
+        total_time = retrieval_time + sum(latency for _, latency in results)
+        return total_score / len(self.dataset), total_time / len(self.dataset)
 
-        for item, result in zip(self.dataset, scoring_results):
-            if isinstance(result, Exception):
-                continue
-            score, _ = result  # type: ignore[misc]
-            total_score += score
+    async def _evaluate_item(
+        self,
+        item: dict[str, str],
+        hits: list[Hit],
+        top_k: int,
+        pbar: tqdm,
+    ) -> tuple[int, float]:
+        # Each gathered item runs in its own task, so this counter only sees this item's LLM calls.
+        waited = [0.0]
+        limiter_wait.set(waited)
+        start_time = time.time()
+        # Hits arrive already reranked, so generation only formats the prompt and calls the model.
+        response = await self.assistant.generate_response(item["question"], use_reranker=False, top_k=top_k, hits=hits)
+        # Time spent queued behind the rate limiter or backing off is throughput, not latency of this item.
+        latency = time.time() - start_time - waited[0]
 
-        return total_score / len(self.dataset), total_time / len(self.dataset)
+        try:
+            score, _ = await self._evaluate_with_llm_as_judge(item["question"], response, item["answer"])
+        except Exception as e:
+            logger.error(f"Error judging response for question '{item['question'][:50]}...': {e}")
+            score = 0
+        pbar.update(1)
+        return score, latency
 
     async def _evaluate_with_llm_as_judge(
         self, instruction: str, response: str, reference_answer: str
@@ -84,7 +114,9 @@ class RAGComparison:
             response=response,
             reference_answer=reference_answer,
         )
-        eval_prompt = await call_llm(self.openai_client, eval_prompt, self.model_name)
+        eval_prompt = await call_llm(
+            self.openai_client, eval_prompt, self.model_name, limiter=self.limiter, cache=self.response_cache
+        )
         try:
             feedback, score = [item.strip() for item in eval_prompt.split("[RESULT]")]
             score = int(score)
@@ -120,32 +152,110 @@ class RetrievalComparison:
             "top_k": top_k,
         }
 
-    def _retrieve_documents(self, query: str, use_reranker: bool = False, top_k: int = 10) -> list:
+    def sweep(self, top_k_values: list[int], multiplier: int = 5) -> tuple[dict[int, dict], dict]:
+        """Evaluate every top_k from a single search and a single scoring pass at the widest candidate set.
+
+        Returns the accuracies per top_k and one timing report for the whole sweep. The stages run once at
+        max(top_k_values) * multiplier candidates, so their cost is not a per-top_k figure. Scores served from the
+        reranker score cache are included as they are, so a rerun with a warm cache reports the cached cost.
+        """
+        total_items = len(self.dataset)
+        questions = [item["question"] for item in self.dataset]
+
+        search_width = max(top_k_values) * multiplier
+        start_time = time.time()
+        hits_per_item = self.vector_db.search_many(questions, limit=search_width)
+        search_time = time.time() - start_time
+        # Scoring itself only resolves what it needs, but the accuracy checks below read every candidate's text.
+        hits_per_item = [resolve_payloads(hits) for hits in hits_per_item]
+
+        first_stage_scores = None
+        first_stage_time = 0.0
+        if self.cross_encoder.cascade_model is not None:
+            start_time = time.time()
+            first_stage_scores = self.cross_encoder.first_stage_scores(questions, hits_per_item)
+            first_stage_time = time.time() - start_time
+
+        start_time = time.time()
+        # The final reranker only scores the candidates that can reach it for at least one top_k.
+        candidate_indices = [
+            sorted(
+                set().union(*(self._candidates(top_k, multiplier, len(hits), first_stage) for top_k in top_k_values))
+            )
+            for hits, first_stage in zip(hits_per_item, first_stage_scores or [None] * total_items)
+        ]
         try:
-            if use_reranker:
-                return self._retrieve_with_reranker(query, top_k)
-            else:
-                return self._retrieve_without_reranker(query, top_k)
+            scores = self.cross_encoder.score_many(
+                questions,
+                [[hits[i] for i in indices] for hits, indices in zip(hits_per_item, candidate_indices)],
+            )
+            scores_per_item = [
+                dict(zip(indices, item_scores)) for indices, item_scores in zip(candidate_indices, scores)
+            ]
         except Exception as e:
-            logger.error(f"Error in retrieval: {e}")
-            return []
+            logger.error(f"Error in reranking: {e}")
+            scores_per_item = [None] * total_items
+        rerank_time = time.time() - start_time
 
-    def _retrieve_with_reranker(self, query: str, top_k: int, multiplier: int = 5) -> list:
-        retrieved_docs, _ = self.vector_db.get_response(query, search_width=top_k * multiplier)
-        return self.cross_encoder.rerank_documents(query, retrieved_docs, reordered_length=top_k)
+        stages = ["without_reranker", "with_reranker"]
+        if first_stage_scores is not None:
+            stages.insert(1, "first_stage")
+        results = {}
+        for top_k in sorted(top_k_values):
+            correct = {"without_reranker": 0, "first_stage": 0, "with_reranker": 0}
+            for index, (item, hits, scores) in enumerate(zip(self.dataset, hits_per_item, scores_per_item)):
+                if any(item["context"] in hit.text for hit in hits[:top_k]):
+                    correct["without_reranker"] += 1
+                first_stage = first_stage_scores[index] if first_stage_scores is not None else None
+                # Rerank the same candidates a standalone run would have retrieved and pruned.
+                candidates = self._candidates(top_k, multiplier, len(hits), first_stage)
+                if first_stage is not None and any(item["context"] in hits[i].text for i in candidates[:top_k]):
+                    correct["first_stage"] += 1
+                if scores is None:
+                    continue
+                reranked = sorted(candidates, key=lambda i: scores[i], reverse=True)[:top_k]
+                if any(item["context"] in hits[i].text for i in reranked):
+                    correct["with_reranker"] += 1
+
+            results[top_k] = {
+                "accuracy": {stage: correct[stage] / total_items for stage in stages},
+                "top_k": top_k,
+            }
+
+        stage_times = {
+            "without_reranker": search_time,
+            "first_stage": search_time + first_stage_time,
+            "with_reranker": search_time + first_stage_time + rerank_time,
+        }
+        timing = {
+            "avg_time": {stage: stage_times[stage] / total_items for stage in stages},
+            "search_width": search_width,
+            "top_k_values": sorted(top_k_values),
+        }
+        return results, timing
 
-    def _retrieve_without_reranker(self, query: str, top_k: int) -> list:
-        retrieved_docs, _ = self.vector_db.get_response(query, search_width=top_k)
-        return [{"name": doc["entity"]["name"], "text": doc["entity"]["text"]} for doc in retrieved_docs[0][:top_k]]
+    def _candidates(self, top_k: int, multiplier: int, num_hits: int, first_stage: list[float] | None) -> list[int]:
+        candidates = list(range(min(top_k * multiplier, num_hits)))
+        if first_stage is None:
+            return candidates
+        ranked = sorted(candidates, key=lambda i: first_stage[i], reverse=True)
+        return ranked[: top_k * self.cross_encoder.cascade_multiplier]
 
-    def _evaluate_retrieval_method(self, use_reranker: bool, top_k: int = 10) -> tuple[int, float]:
+    def _evaluate_retrieval_method(self, use_reranker: bool, top_k: int = 10, multiplier: int = 5) -> tuple[int, float]:
         correct_count = 0
-        total_time = 0.0
-        for item in self.dataset:
-            start_time = time.time()
-            retrieved_docs = self._retrieve_documents(item["question"], use_reranker, top_k)
+        start_time = time.time()
+        questions = [item["question"] for item in self.dataset]
+        search_width = top_k * multiplier if use_reranker else top_k
+        try:
+            responses = self.vector_db.search_many(questions, limit=search_width)
+            if use_reranker:
+                responses = self.cross_encoder.rerank_many(questions, responses, top_k=top_k)
+        except Exception as e:
+            logger.error(f"Error in retrieval: {e}")
+            responses = [[] for _ in questions]
+
+        for item, retrieved_docs in zip(self.dataset, responses):
             # Check if the expected context is in the retrieved documents:
-            if any(item["context"] in doc["text"] for doc in retrieved_docs):
+            if any(item["context"] in doc.text for doc in resolve_payloads(retrieved_docs[:top_k])):
                 correct_count += 1
-            total_time += time.time() - start_time
-        return correct_count, total_time
+        return correct_count, time.time() - start_time
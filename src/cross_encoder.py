@@ -1,26 +1,186 @@
-import json
+from typing import Literal
 
-from langchain_community.document_transformers import LongContextReorder
+import numpy as np
+import torch
 from sentence_transformers import CrossEncoder as SentenceTransformersCrossEncoder
 
-from utils import get_device, truncate
+from bm25 import bm25_scores
+from cache import ScoreCache
+from utils import get_device, normalize_query
+from vector_db import Hit, resolve_payloads
+
+CrossEncoderBackend = Literal["torch", "torch-int8", "onnx"]
 
 
 class CrossEncoder:
-    def __init__(self, model_name: str = "BAAI/bge-reranker-v2-m3") -> None:
-        self.cross_encoder = SentenceTransformersCrossEncoder(model_name, device=get_device())
-        self.max_length = self.cross_encoder.max_length
-
-    def rerank_format_documents(
-        self, query: str, answer_list: list, reordered_length: int = 10
-    ) -> tuple[list[dict], str]:
-        selected_docs = self.rerank_documents(query, answer_list, reordered_length)
-        reordered = LongContextReorder().transform_documents(selected_docs)
-        return selected_docs, json.dumps(reordered)
-
-    def rerank_documents(self, query: str, answer_list: list, reordered_length: int = 10) -> list[dict]:
-        docs = [{"name": item["entity"]["name"], "text": item["entity"]["text"]} for item in answer_list[0]]
-        pairs = [(query, truncate(doc["text"], self.max_length // 2)) for doc in docs]
-        scores = self.cross_encoder.predict(pairs)
-        docs_with_scores = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
-        return [doc for doc, _ in docs_with_scores[:reordered_length]]
+    def __init__(
+        self,
+        model_name: str = "BAAI/bge-reranker-v2-m3",
+        batch_size: int = 64,
+        window_aggregation: Literal["max", "mean"] | None = None,
+        window_overlap: int = 64,
+        max_length: int = 512,
+        backend: CrossEncoderBackend = "torch",
+        score_cache_size: int = 100_000,
+        score_cache_path: str | None = None,
+        cascade_model: str | None = None,
+        cascade_multiplier: int = 2,
+    ) -> None:
+        self.model_name = model_name
+        self.backend = backend
+        self.cross_encoder = _load_cross_encoder(model_name, backend, max_length)
+        self.tokenizer = self.cross_encoder.tokenizer
+        # Set explicitly: rerankers such as bge-reranker-v2-m3 advertise 8192 tokens, which would make every
+        # passage a single full-length pair and leave windowing unused.
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.window_aggregation = window_aggregation
+        self.window_overlap = window_overlap
+        self._special_tokens = self.tokenizer.num_special_tokens_to_add(pair=True)
+        # Everything that changes a score is part of the namespace, so differently configured rerankers never
+        # read each other's entries.
+        namespace = f"{model_name}:{backend}:{max_length}:{window_aggregation}:{window_overlap}"
+        self.score_cache = ScoreCache(namespace, maxsize=score_cache_size, db_path=score_cache_path)
+
+        # Optional cheap first stage ("bm25" or a small cross-encoder) that prunes candidates to
+        # top_k * cascade_multiplier before this model scores them.
+        self.cascade_model = cascade_model
+        self.cascade_multiplier = cascade_multiplier
+        self._first_stage = None
+        if cascade_model is not None and cascade_model != "bm25":
+            self._first_stage = CrossEncoder(
+                cascade_model,
+                batch_size=batch_size,
+                max_length=max_length,
+                backend=backend,
+                score_cache_size=score_cache_size,
+                score_cache_path=score_cache_path,
+            )
+
+    def rerank_documents(self, query: str, hits: list[Hit], reordered_length: int = 10) -> list[Hit]:
+        return self.rerank_many([query], [hits], reordered_length)[0]
+
+    def rerank_many(self, queries: list[str], candidate_lists: list[list[Hit]], top_k: int = 10) -> list[list[Hit]]:
+        if self.cascade_model is not None:
+            candidate_lists = self.prune(queries, candidate_lists, top_k * self.cascade_multiplier)
+        scores = self.score_many(queries, candidate_lists)
+        return [_top(hits, hit_scores, top_k) for hits, hit_scores in zip(candidate_lists, scores)]
+
+    def prune(self, queries: list[str], candidate_lists: list[list[Hit]], width: int) -> list[list[Hit]]:
+        scores = self.first_stage_scores(queries, candidate_lists)
+        return [_top(hits, hit_scores, width) for hits, hit_scores in zip(candidate_lists, scores)]
+
+    def first_stage_scores(self, queries: list[str], candidate_lists: list[list[Hit]]) -> list[list[float]]:
+        if self._first_stage is not None:
+            return self._first_stage.score_many(queries, candidate_lists)
+        return [
+            bm25_scores(query, [hit.text for hit in resolve_payloads(hits)])
+            for query, hits in zip(queries, candidate_lists)
+        ]
+
+    def score_documents(self, query: str, hits: list[Hit]) -> list[float]:
+        return self.score_many([query], [hits])[0]
+
+    def score_many(self, queries: list[str], candidate_lists: list[list[Hit]]) -> list[list[float]]:
+        queries = [normalize_query(query) for query in queries]
+        cached = [
+            self.score_cache.get_many(query, [hit.id for hit in hits]) for query, hits in zip(queries, candidate_lists)
+        ]
+        # Only passages without a cached score need their text, so lazy hits are resolved after the cache lookup.
+        missing_lists = [
+            resolve_payloads([hit for hit in hits if hit.id not in found])
+            for hits, found in zip(candidate_lists, cached)
+        ]
+        fresh_lists = self._score_many(queries, missing_lists)
+
+        for query, hits, fresh, found in zip(queries, missing_lists, fresh_lists, cached):
+            fresh_scores = {hit.id: score for hit, score in zip(hits, fresh)}
+            self.score_cache.put_many(query, fresh_scores)
+            found.update(fresh_scores)
+        return [[found[hit.id] for hit in hits] for hits, found in zip(candidate_lists, cached)]
+
+    def _score_many(self, queries: list[str], candidate_lists: list[list[Hit]]) -> list[list[float]]:
+        if not any(candidate_lists):
+            return [[] for _ in candidate_lists]
+        query_lengths = [len(ids) for ids in self.tokenizer(queries, add_special_tokens=False)["input_ids"]]
+        offsets = self._passage_offsets(list({hit.text for hits in candidate_lists for hit in hits}))
+
+        pairs = []
+        lengths = []
+        owners = []
+        owner = 0
+        for query, query_length, hits in zip(queries, query_lengths, candidate_lists):
+            budget = max(1, self.max_length - query_length - self._special_tokens)
+            for hit in hits:
+                for window, window_length in self._windows(hit.text, offsets[hit.text], budget):
+                    pairs.append((query, window))
+                    lengths.append(query_length + window_length)
+                    owners.append(owner)
+                owner += 1
+
+        window_scores: list[list[float]] = [[] for _ in range(owner)]
+        for index, score in zip(owners, self._predict(pairs, lengths).tolist()):
+            window_scores[index].append(score)
+        aggregate = np.mean if self.window_aggregation == "mean" else max
+        scores = [float(aggregate(passage_scores)) for passage_scores in window_scores]
+
+        split_scores = []
+        position = 0
+        for hits in candidate_lists:
+            split_scores.append(scores[position : position + len(hits)])
+            position += len(hits)
+        return split_scores
+
+    def _passage_offsets(self, texts: list[str]) -> dict[str, list[tuple[int, int]]]:
+        if not texts:
+            return {}
+        encoded = self.tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)
+        return dict(zip(texts, encoded["offset_mapping"]))
+
+    def _windows(self, text: str, offsets: list[tuple[int, int]], budget: int) -> list[tuple[str, int]]:
+        # Cuts happen at token boundaries, so each window fills the pair budget instead of a character guess.
+        if len(offsets) <= budget:
+            return [(text, len(offsets))]
+        if self.window_aggregation is None:
+            return [(text[: offsets[budget - 1][1]], budget)]
+
+        windows = []
+        stride = max(1, budget - self.window_overlap)
+        for start in range(0, len(offsets), stride):
+            end = min(start + budget, len(offsets))
+            windows.append((text[offsets[start][0] : offsets[end - 1][1]], end - start))
+            if end == len(offsets):
+                break
+        return windows
+
+    def _predict(self, pairs: list[tuple[str, str]], lengths: list[int]) -> np.ndarray:
+        scores = np.empty(len(pairs), dtype=np.float32)
+        if not pairs:
+            return scores
+        # Pairs of similar token length share a batch, so padding stays small even when many queries are mixed.
+        order = sorted(range(len(pairs)), key=lambda i: lengths[i])
+        scores[order] = self.cross_encoder.predict(
+            [pairs[i] for i in order],
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+        )
+        return scores
+
+
+def _top(hits: list[Hit], scores: list[float], k: int) -> list[Hit]:
+    hits_with_scores = sorted(zip(hits, scores), key=lambda x: x[1], reverse=True)
+    return [hit for hit, _ in hits_with_scores[:k]]
+
+
+def _load_cross_encoder(
+    model_name: str, backend: CrossEncoderBackend, max_length: int
+) -> SentenceTransformersCrossEncoder:
+    if backend == "onnx":
+        # Requires the optional ONNX Runtime extras: pip install "sentence-transformers[onnx]"
+        return SentenceTransformersCrossEncoder(model_name, device="cpu", backend="onnx", max_length=max_length)
+    if backend == "torch-int8":
+        # Dynamic quantization only has CPU kernels, so the model stays on CPU regardless of get_device().
+        cross_encoder = SentenceTransformersCrossEncoder(model_name, device="cpu", max_length=max_length)
+        torch.ao.quantization.quantize_dynamic(cross_encoder.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return cross_encoder
+    return SentenceTransformersCrossEncoder(model_name, device=get_device(), max_length=max_length)
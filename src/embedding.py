@@ -1,23 +1,140 @@
+import multiprocessing as mp
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
-from utils import get_device
+from cache import EmbeddingCache, LRUCache, text_digest
+from utils import available_cpus, batched, get_device, normalize_query
+
+_worker_model: SentenceTransformer | None = None
+
+
+def _init_worker(model_name: str, num_threads: int) -> None:
+    global _worker_model
+    torch.set_num_threads(num_threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_chunk(chunk: tuple[list[str], int]) -> np.ndarray:
+    texts, batch_size = chunk
+    return _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True)  # type: ignore[union-attr]
 
 
 class EmbeddingModel:
     def __init__(
         self,
         model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        batch_size: int = 64,
+        num_workers: int = 0,
+        threads_per_worker: int | None = None,
+        cache_dir: str | None = None,
+        query_cache_size: int = 1024,
+        query_cache_ttl: float | None = 3600.0,
     ) -> None:
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name, device=get_device())
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(1, available_cpus() // max(1, num_workers))
+        self._pool = None
+        self.cache = EmbeddingCache(cache_dir, model_name, self.dimension) if cache_dir else None
+        self.query_cache = LRUCache(maxsize=query_cache_size, ttl=query_cache_ttl)
 
     def __call__(self, documents: list[list[dict[str, str]]]) -> list[list[dict[str, str]]]:
+        texts = [point.get("text", "") for document in documents for point in document]
+        vectors = self.encode(texts, show_progress_bar=True, use_pool=True)
+
         vector_laws = []
-        for document in tqdm(documents, unit="law", desc="Processing laws"):
+        position = 0
+        for document in documents:
             processed_points = []
             for point in document:
-                text = point.get("text", "")
-                emb = self.model.encode(text)
-                processed_points.append(point | {"vector": emb})
+                processed_points.append(point | {"vector": vectors[position]})
+                position += 1
             vector_laws.append(processed_points)
         return vector_laws
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def embed_stream(self, sections: Iterable[dict[str, str]], chunk_size: int = 2048) -> Iterator[list[dict]]:
+        with tqdm(unit="section", desc="Embedding sections") as progress:
+            for chunk in batched(sections, chunk_size):
+                vectors = self.encode([section.get("text", "") for section in chunk], use_pool=True)
+                yield [section | {"vector": vector} for section, vector in zip(chunk, vectors)]
+                progress.update(len(chunk))
+
+    def encode_queries(self, queries: list[str]) -> np.ndarray:
+        normalized = [normalize_query(query) for query in queries]
+        vectors = np.empty((len(queries), self.dimension), dtype=np.float32)
+        missing = []
+        for i, query in enumerate(normalized):
+            vector = self.query_cache.get(query)
+            if vector is None:
+                missing.append(i)
+            else:
+                vectors[i] = vector
+        if missing:
+            # Queries stay out of the on-disk corpus cache, which is never evicted and would grow with every query.
+            fresh = self._encode([normalized[i] for i in missing])
+            vectors[missing] = fresh
+            for i, vector in zip(missing, fresh):
+                self.query_cache.put(normalized[i], vector)
+        return vectors
+
+    def encode(self, texts: list[str], show_progress_bar: bool = False, use_pool: bool = False) -> np.ndarray:
+        if self.cache is None:
+            return self._encode(texts, show_progress_bar, use_pool)
+
+        digests = [text_digest(text) for text in texts]
+        vectors, missing = self.cache.get_many(digests)
+        if missing:
+            fresh = self._encode([texts[i] for i in missing], show_progress_bar, use_pool)
+            vectors[missing] = fresh
+            self.cache.put_many([digests[i] for i in missing], fresh)
+        return vectors
+
+    def _encode(self, texts: list[str], show_progress_bar: bool = False, use_pool: bool = False) -> np.ndarray:
+        # Sorting by length keeps every batch close to uniform, so padding stays minimal.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        buckets = [order[start : start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+
+        # Only corpus indexing uses the worker pool. Queries and re-scoring stay on the in-process model, so they
+        # never restart a pool that close() has already shut down.
+        if use_pool and self.num_workers > 1 and len(buckets) > 1:
+            chunks = (([texts[i] for i in bucket], self.batch_size) for bucket in buckets)
+            encoded = self._get_pool().imap(_encode_chunk, chunks)
+        else:
+            encoded = (
+                self.model.encode([texts[i] for i in bucket], batch_size=self.batch_size, convert_to_numpy=True)
+                for bucket in buckets
+            )
+
+        progress = tqdm(total=len(buckets), unit="batch", desc="Embedding sections", disable=not show_progress_bar)
+        with progress:
+            for bucket, bucket_vectors in zip(buckets, encoded):
+                vectors[bucket] = bucket_vectors
+                progress.update(1)
+        return vectors
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # Each worker holds its own CPU model copy; capping torch threads stops the workers from
+            # oversubscribing the cores they share.
+            self._pool = mp.get_context("spawn").Pool(
+                self.num_workers,
+                initializer=_init_worker,
+                initargs=(self.model_name, self.threads_per_worker),
+            )
+        return self._pool
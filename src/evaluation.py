@@ -1,27 +1,144 @@
 import asyncio
 import json
 import logging
+import os
+import random
+from collections.abc import AsyncIterator
+from contextlib import nullcontext
+from typing import Literal, TextIO
 
+import openai
 from openai import AsyncOpenAI
 from tqdm.auto import tqdm
 
+from cache import ResponseCache
 from prompts import (
+    QA_CRITIQUE_COMBINED,
     QA_CRITIQUE_GROUNDEDNESS,
     QA_CRITIQUE_RELEVANCE,
     QA_CRITIQUE_STANDALONE,
     QA_GENERATION_PROMPT,
 )
+from rate_limit import RateLimiter, limiter_wait
+from utils import dumps
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def call_llm(openai_client: AsyncOpenAI, query: str, model_name: str):
-    completion = await openai_client.chat.completions.create(
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+MIN_CRITIQUE_SCORES = {"groundedness": 3, "relevance": 3, "standalone": 3}
+
+
+async def call_llm(
+    openai_client: AsyncOpenAI,
+    query: str,
+    model_name: str,
+    *,
+    limiter: RateLimiter | None = None,
+    cache: ResponseCache | None = None,
+    max_retries: int = 6,
+    expected_output_tokens: int = 512,
+):
+    if cache is not None:
+        cached = cache.get(model_name, query)
+        if cached is not None:
+            return cached
+
+    # Roughly four characters per token; the limiter is corrected with the real usage afterwards.
+    estimated_tokens = len(query) // 4 + expected_output_tokens
+    for attempt in range(max_retries + 1):
+        try:
+            if limiter is None:
+                completion = await _create_completion(openai_client, query, model_name)
+            else:
+                async with limiter.limit(estimated_tokens):
+                    completion = await _create_completion(openai_client, query, model_name)
+                if completion.usage is not None:
+                    limiter.record_tokens(estimated_tokens, completion.usage.total_tokens)
+            response = completion.choices[0].message.content
+            # An empty completion is not worth replaying; the next run asks again.
+            if cache is not None and response:
+                cache.put(model_name, query, response)
+            return response
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = _retry_delay(e, attempt)
+            logger.warning(f"LLM call failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            waited = limiter_wait.get()
+            if waited is not None:
+                waited[0] += delay
+            await asyncio.sleep(delay)
+
+
+async def call_llm_stream(
+    openai_client: AsyncOpenAI,
+    query: str,
+    model_name: str,
+    *,
+    limiter: RateLimiter | None = None,
+    cache: ResponseCache | None = None,
+    max_retries: int = 6,
+    expected_output_tokens: int = 512,
+) -> AsyncIterator[str]:
+    """Like call_llm, but yields the completion in chunks as the model produces them."""
+    if cache is not None:
+        cached = cache.get(model_name, query)
+        if cached is not None:
+            yield cached
+            return
+
+    estimated_tokens = len(query) // 4 + expected_output_tokens
+    for attempt in range(max_retries + 1):
+        chunks: list[str] = []
+        try:
+            async with limiter.limit(estimated_tokens) if limiter is not None else nullcontext():
+                stream = await openai_client.chat.completions.create(
+                    model=model_name,
+                    messages=[{"role": "user", "content": query}],
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                # Closing the stream releases the connection when the caller stops reading early.
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.usage is not None and limiter is not None:
+                            limiter.record_tokens(estimated_tokens, chunk.usage.total_tokens)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            chunks.append(chunk.choices[0].delta.content)
+                            yield chunks[-1]
+            if cache is not None and chunks:
+                cache.put(model_name, query, "".join(chunks))
+            return
+        except RETRYABLE_ERRORS as e:
+            # Text the caller has already shown cannot be taken back, so only a stream that failed before
+            # its first chunk is retried.
+            if attempt == max_retries or chunks:
+                raise
+            delay = _retry_delay(e, attempt)
+            logger.warning(f"LLM stream failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def _create_completion(openai_client: AsyncOpenAI, query: str, model_name: str):
+    return await openai_client.chat.completions.create(
         model=model_name,
         messages=[{"role": "user", "content": query}],
     )
-    return completion.choices[0].message.content
+
+
+def _retry_delay(error: Exception, attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    # Honour the server's Retry-After when it sends one, otherwise back off exponentially with full jitter.
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after is not None:
+        try:
+            return min(cap, float(retry_after)) + random.uniform(0, base)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2**attempt))
 
 
 class EvaluationDatasetGenerator:
@@ -30,25 +147,76 @@ class EvaluationDatasetGenerator:
         openai_client: AsyncOpenAI,
         model_name: str,
         context_list: list[dict[str, str]],
+        limiter: RateLimiter | None = None,
+        num_workers: int = 16,
+        response_cache: ResponseCache | None = None,
+        critique_mode: Literal["combined", "separate"] = "combined",
     ):
         self.openai_client = openai_client
+        self.critique_mode = critique_mode
+        self.limiter = limiter
+        self.response_cache = response_cache
         self.context_list = context_list
         self.model_name = model_name
+        self.num_workers = num_workers
+
+    async def __call__(self, file_path: str | None = None, checkpoint_path: str | None = None):
+        records = _load_checkpoint(checkpoint_path) if checkpoint_path else []
+        done = {(record["name"], record["context"]) for record in records}
+        pending = [context for context in self.context_list if (context["name"], context["text"]) not in done]
+        if done:
+            logger.info(f"Resuming from {checkpoint_path}: {len(done)} contexts done, {len(pending)} left")
 
-    async def __call__(self, file_path: str | None = None):
-        result = await self._generate_questions()
-        result = await self._fill_dataset(result)
-        result = _remove_low_scores(result)
+        with open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else nullcontext() as checkpoint:
+            records.extend(await self._process_contexts(pending, checkpoint))
+
+        # Contexts whose Q&A could not be parsed are checkpointed too, so they are not paid for again.
+        result = _remove_low_scores([record for record in records if record.get("question")])
         if file_path:
             with open(file_path, "w", encoding="utf-8") as f:
                 json.dump(result, f, indent=4, ensure_ascii=False)
         return result
 
+    async def _process_contexts(self, contexts: list[dict[str, str]], checkpoint: TextIO | None) -> list[dict]:
+        # A fixed pool of workers pulls the next context as soon as it finishes one, so a slow call only
+        # holds up its own worker instead of a whole batch.
+        queue: asyncio.Queue[dict[str, str]] = asyncio.Queue()
+        for context in contexts:
+            queue.put_nowait(context)
+        records = []
+
+        async def worker(pbar: tqdm):
+            while not queue.empty():
+                context = queue.get_nowait()
+                try:
+                    record = await self._process_context(context)
+                except Exception as e:
+                    # Not checkpointed, so the context is retried on the next run.
+                    logger.error(f"Error processing context '{context['name']}': {e}")
+                else:
+                    records.append(record)
+                    if checkpoint is not None:
+                        checkpoint.write(dumps(record) + "\n")
+                        checkpoint.flush()
+                pbar.update(1)
+
+        with tqdm(total=len(contexts), desc="Generating and evaluating Q&A", unit="q_and_a") as pbar:
+            await asyncio.gather(*[worker(pbar) for _ in range(min(self.num_workers, len(contexts)))])
+        return records
+
+    async def _process_context(self, context: dict[str, str]) -> dict:
+        output = await self._generate_single_question(context)
+        if output is None:
+            return {"name": context["name"], "context": context["text"], "question": None}
+        return await self._evaluate_single_output(output)
+
     async def _generate_single_question(self, context: dict[str, str]):
         result_dict = {"name": context["name"], "context": context["text"]}
         query = QA_GENERATION_PROMPT.format(context=context["text"])
         try:
-            response = await call_llm(self.openai_client, query, self.model_name)
+            response = await call_llm(
+                self.openai_client, query, self.model_name, limiter=self.limiter, cache=self.response_cache
+            )
             result_dict["question"] = response.split("Factoid question: ")[1].split("Answer: ")[0].strip()
             result_dict["answer"] = response.split("Answer: ")[1].strip()
             return result_dict
@@ -56,95 +224,115 @@ class EvaluationDatasetGenerator:
             logger.error(f"Error parsing response for context '{context['name']}': {e}")
             return None
 
-    async def _generate_questions(self):
-        tasks = [self._generate_single_question(context) for context in self.context_list]
-        results = []
-        with tqdm(total=len(tasks), desc="Generating Q&A", unit="q_and_a") as pbar:
-            batch_size = 10
-            for i in range(0, len(tasks), batch_size):
-                batch_tasks = tasks[i : i + batch_size]
-                batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
+    async def _evaluate_single_output(self, output: dict):
+        if self.critique_mode == "separate":
+            await asyncio.gather(*[self._evaluate_criterion(output, criterion) for criterion in MIN_CRITIQUE_SCORES])
+            return output
 
-                for result in batch_results:
-                    if isinstance(result, Exception):
-                        logger.error(f"Error in batch processing: {result}")
-                    elif result is not None:
-                        results.append(result)
-                    pbar.update(1)
+        response = await call_llm(
+            self.openai_client,
+            QA_CRITIQUE_COMBINED.format(question=output["question"], context=output["context"]),
+            self.model_name,
+            limiter=self.limiter,
+            cache=self.response_cache,
+        )
+        for criterion, (score, eval_text) in _parse_combined_critique(response).items():
+            output.update({f"{criterion}_score": score, f"{criterion}_eval": eval_text})
 
-        return results
+        # Criteria the combined response did not cover are asked one by one, cheapest prompt first, and a question
+        # that already fails one criterion is not critiqued any further.
+        for criterion in ("relevance", "standalone", "groundedness"):
+            if _fails_critique(output):
+                break
+            if f"{criterion}_score" not in output:
+                await self._evaluate_criterion(output, criterion)
+        return output
 
-    async def _evaluate_single_output(self, output: dict):
-        evaluation_tasks = {
-            "groundedness": call_llm(
-                self.openai_client,
-                QA_CRITIQUE_GROUNDEDNESS.format(question=output["question"], context=output["context"]),
-                self.model_name,
-            ),
-            "relevance": call_llm(
-                self.openai_client,
-                QA_CRITIQUE_RELEVANCE.format(question=output["question"]),
-                self.model_name,
-            ),
-            "standalone": call_llm(
-                self.openai_client,
-                QA_CRITIQUE_STANDALONE.format(question=output["question"]),
-                self.model_name,
-            ),
-        }
+    async def _evaluate_criterion(self, output: dict, criterion: str):
+        prompt = {
+            "groundedness": QA_CRITIQUE_GROUNDEDNESS,
+            "relevance": QA_CRITIQUE_RELEVANCE,
+            "standalone": QA_CRITIQUE_STANDALONE,
+        }[criterion].format(question=output["question"], context=output["context"])
+        try:
+            evaluation = await call_llm(
+                self.openai_client, prompt, self.model_name, limiter=self.limiter, cache=self.response_cache
+            )
+        except Exception as e:
+            logger.error(f"Error evaluating {criterion} for question '{output['question'][:50]}...': {e}")
+            # A failed call is not a low score; raising keeps the context out of the checkpoint for a retry.
+            raise
 
         try:
-            evaluations = await asyncio.gather(*[task for task in evaluation_tasks.values()], return_exceptions=True)
-            for criterion, evaluation in zip(evaluation_tasks.keys(), evaluations):
-                if isinstance(evaluation, Exception):
-                    logger.error(
-                        f"Error evaluating {criterion} for question '{output['question'][:50]}...': {evaluation}"
-                    )
-                    continue
-
-                score, eval_text = (
-                    int(evaluation.split("Total rating: ")[-1].strip()),  # type: ignore[union-attr]
-                    evaluation.split("Total rating: ")[-2]  # type: ignore[union-attr]
-                    .split("Evaluation: ")[1]
-                    .strip(),
-                )
-                output.update({f"{criterion}_score": score, f"{criterion}_eval": eval_text})
+            score, eval_text = (
+                int(evaluation.split("Total rating: ")[-1].strip()),  # type: ignore[union-attr]
+                evaluation.split("Total rating: ")[-2]  # type: ignore[union-attr]
+                .split("Evaluation: ")[1]
+                .strip(),
+            )
+            output.update({f"{criterion}_score": score, f"{criterion}_eval": eval_text})
         except Exception as e:
-            logger.error(f"Error processing evaluation for question '{output['question'][:50]}...': {e}")
+            logger.error(f"Error processing {criterion} evaluation for question '{output['question'][:50]}...': {e}")
 
-        return output
 
-    async def _fill_dataset(self, outputs):
-        logger.info("Evaluating questions...")
-        tasks = [self._evaluate_single_output(output) for output in outputs]
-        results = []
-        with tqdm(total=len(tasks), desc="Evaluating questions", unit="eval_q") as pbar:
-            batch_size = 5
-            for i in range(0, len(tasks), batch_size):
-                batch_tasks = tasks[i : i + batch_size]
-                batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-                for result in batch_results:
-                    if isinstance(result, Exception):
-                        logger.error(f"Error in evaluation batch: {result}")
-                    else:
-                        results.append(result)
-                    pbar.update(1)
-        return results
-
-
-def _remove_low_scores(
-    outputs: list[dict],
-    min_groundedness_score: int = 3,
-    min_relevance_score: int = 3,
-    min_standalone_score: int = 3,
-):
-    filtered_outputs = []
-    for output in outputs:
-        if output.get("groundedness_score") and output.get("relevance_score") and output.get("standalone_score"):
-            if (
-                output["groundedness_score"] >= min_groundedness_score
-                and output["relevance_score"] >= min_relevance_score
-                and output["standalone_score"] >= min_standalone_score
-            ):
-                filtered_outputs.append(output)
-    return filtered_outputs
+def _load_checkpoint(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "rb+") as f:
+        offset = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                # A crash mid-write tears the last line. Cutting it lets the next append start a line of its own,
+                # and its context is simply redone.
+                logger.warning(f"Dropping torn last line of {path}")
+                f.truncate(offset)
+                break
+            offset += len(line)
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable checkpoint line in {path}")
+    return records
+
+
+def _parse_combined_critique(response: str | None) -> dict[str, tuple[int, str]]:
+    """Extract the valid (rating, evaluation) pairs from a combined critique; anything malformed is left out."""
+    if not response:
+        return {}
+    # Models sometimes wrap the object in a code fence or add a sentence around it.
+    start, end = response.find("{"), response.rfind("}")
+    try:
+        data = json.loads(response[start : end + 1]) if start != -1 else None
+    except json.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict):
+        logger.warning("Could not parse combined critique, falling back to one call per criterion")
+        return {}
+
+    critiques = {}
+    data = {str(key).lower(): value for key, value in data.items()}
+    for criterion in ("groundedness", "relevance", "standalone"):
+        critique = data.get(criterion)
+        if not isinstance(critique, dict):
+            continue
+        try:
+            score = int(float(critique.get("rating", critique.get("score"))))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= score <= 5:
+            critiques[criterion] = (score, str(critique.get("evaluation", "")).strip())
+    return critiques
+
+
+def _fails_critique(output: dict, min_scores: dict[str, int] = MIN_CRITIQUE_SCORES) -> bool:
+    return any(output.get(f"{criterion}_score", minimum) < minimum for criterion, minimum in min_scores.items())
+
+
+def _remove_low_scores(outputs: list[dict], min_scores: dict[str, int] = MIN_CRITIQUE_SCORES) -> list[dict]:
+    # Questions missing a score, because it could not be parsed or was skipped after an early fail, are dropped too.
+    return [
+        output
+        for output in outputs
+        if all(output.get(f"{criterion}_score", 0) >= minimum for criterion, minimum in min_scores.items())
+    ]
@@ -1,12 +1,13 @@
 import streamlit as st
 from openai import AsyncOpenAI
-from pymilvus import MilvusClient
 
+from bm25 import BM25Index
 from cross_encoder import CrossEncoder
 from embedding import EmbeddingModel
 from law_assistant import LawAssistant
 from settings import Settings
-from vector_db import VectorDB
+from text_store import TextStore
+from vector_db import VectorDB, create_vector_client
 
 
 class LawBot:
@@ -28,23 +29,54 @@ class LawBot:
             st.chat_message("user").markdown(prompt)
             st.session_state.messages.append({"role": "user", "message": prompt})
 
-            resp = self.assistant.generate_response_sync(prompt, use_reranker=False)
-            st.chat_message("bot").markdown(resp)
+            # Chunks are rendered as they arrive, so the answer starts appearing after the first token.
+            resp = st.chat_message("bot").write_stream(self.assistant.stream_response_sync(prompt, use_reranker=False))
             st.session_state.messages.append({"role": "bot", "message": resp})
 
 
-if __name__ == "__main__":
+@st.cache_resource
+def load_retrieval() -> tuple[VectorDB, CrossEncoder]:
+    # Streamlit re-runs this script on every interaction. Building the models once per server process keeps them,
+    # and their query embedding, retrieval and score caches, alive across reruns and sessions.
     settings = Settings()
-
-    openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
     embedding_model = EmbeddingModel(
         settings.embedding_model,
+        batch_size=settings.embedding_batch_size,
+        cache_dir=settings.embedding_cache_dir,
+        query_cache_size=settings.query_cache_size,
+        query_cache_ttl=settings.query_cache_ttl,
+    )
+    milvus_client = create_vector_client(settings)
+    vector_db = VectorDB(
+        embedding_model=embedding_model,
+        milvus_client=milvus_client,
+        result_cache_size=settings.result_cache_size,
+        sparse_index=BM25Index(settings.sparse_index_path) if settings.retrieval_mode == "hybrid" else None,
+        index_profile=settings.milvus_index_profile,
+        vector_dtype=settings.vector_dtype,
+        rescore_multiplier=settings.rescore_multiplier,
+        text_store=TextStore(settings.text_store_dir) if settings.payload_mode == "lazy" else None,
     )
-    milvus_client = MilvusClient(uri=settings.milvus_uri, token=settings.milvus_token)
-    vector_db = VectorDB(embedding_model=embedding_model, milvus_client=milvus_client)
     cross_encoder = CrossEncoder(
         settings.cross_encoder_model,
+        batch_size=settings.cross_encoder_batch_size,
+        window_aggregation=settings.cross_encoder_window_aggregation,
+        max_length=settings.cross_encoder_max_length,
+        backend=settings.cross_encoder_backend,
+        score_cache_size=settings.rerank_cache_size,
+        score_cache_path=settings.rerank_cache_path,
+        cascade_model=settings.rerank_cascade_model,
+        cascade_multiplier=settings.rerank_cascade_multiplier,
     )
+    return vector_db, cross_encoder
+
+
+if __name__ == "__main__":
+    settings = Settings()
+    vector_db, cross_encoder = load_retrieval()
+
+    # The async client stays per run: its connections belong to the event loop of the run that opened them.
+    openai_client = AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
     law_assistant = LawAssistant(
         vector_db=vector_db,
         cross_encoder=cross_encoder,
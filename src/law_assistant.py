@@ -1,12 +1,17 @@
 import asyncio
 import logging
+from collections.abc import AsyncIterator, Iterator
 
+from langchain_community.document_transformers import LongContextReorder
 from openai import AsyncOpenAI
 
+from cache import ResponseCache
 from cross_encoder import CrossEncoder
-from evaluation import call_llm
+from evaluation import call_llm, call_llm_stream
 from prompts import RAG_RESPONSE_PROMPT
-from vector_db import VectorDB
+from rate_limit import RateLimiter
+from utils import dumps
+from vector_db import Hit, VectorDB, resolve_payloads
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,8 +24,12 @@ class LawAssistant:
         cross_encoder: CrossEncoder,
         openai_client: AsyncOpenAI,
         model_name: str = "gpt-4.1-nano-2025-04-14",
+        limiter: RateLimiter | None = None,
+        response_cache: ResponseCache | None = None,
     ):
         self.openai_client = openai_client
+        self.limiter = limiter
+        self.response_cache = response_cache
         self.db = vector_db
         self.cross_encoder = cross_encoder
         self.model_name = model_name
@@ -33,16 +42,13 @@ class LawAssistant:
         *,
         top_k: int = 5,
         multiplier: int = 2,
+        hits: list[Hit] | None = None,
     ):
         try:
-            if use_reranker:
-                response, formatted = self.db.get_response(query, search_width=top_k * multiplier)
-                _, formatted = self.cross_encoder.rerank_format_documents(query, response, top_k)
-            else:
-                _, formatted = self.db.get_response(query, search_width=top_k)
-
-            prompt = RAG_RESPONSE_PROMPT.format(context=formatted, question=query)
-            response = await call_llm(self.openai_client, prompt, self.model_name)
+            prompt = self._build_prompt(query, use_reranker, top_k, multiplier, hits)
+            response = await call_llm(
+                self.openai_client, prompt, self.model_name, limiter=self.limiter, cache=self.response_cache
+            )
             return response
 
         except Exception as e:
@@ -58,3 +64,74 @@ class LawAssistant:
         multiplier: int = 2,
     ):
         return asyncio.run(self.generate_response(query, use_reranker, top_k=top_k, multiplier=multiplier))
+
+    async def stream_response(
+        self,
+        query: str,
+        use_reranker: bool = True,
+        *,
+        top_k: int = 5,
+        multiplier: int = 2,
+        hits: list[Hit] | None = None,
+    ) -> AsyncIterator[str]:
+        """Yield the answer in chunks as the model writes it, for display before the completion is finished."""
+        try:
+            prompt = self._build_prompt(query, use_reranker, top_k, multiplier, hits)
+            async for chunk in call_llm_stream(
+                self.openai_client, prompt, self.model_name, limiter=self.limiter, cache=self.response_cache
+            ):
+                yield chunk
+
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            yield f"I apologize, but I encountered an error while processing your query: {str(e)}"
+
+    def stream_response_sync(
+        self,
+        query: str,
+        use_reranker: bool = True,
+        *,
+        top_k: int = 5,
+        multiplier: int = 2,
+    ) -> Iterator[str]:
+        # Drives the async generator one chunk at a time on a private event loop, for synchronous callers such
+        # as Streamlit that consume a plain iterator.
+        loop = asyncio.new_event_loop()
+        chunks = self.stream_response(query, use_reranker, top_k=top_k, multiplier=multiplier)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(anext(chunks))
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(chunks.aclose())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def rerank_many(self, queries: list[str], candidate_lists: list[list[Hit]], top_k: int) -> list[list[Hit]]:
+        """Rerank every query's candidates in one batch and order each context the way the prompt expects."""
+        reranked = self.cross_encoder.rerank_many(queries, candidate_lists, top_k)
+        return [LongContextReorder().transform_documents(hits) for hits in reranked]
+
+    def _build_prompt(
+        self,
+        query: str,
+        use_reranker: bool,
+        top_k: int,
+        multiplier: int,
+        hits: list[Hit] | None,
+    ) -> str:
+        # Candidates may be prefetched by the caller, e.g. through VectorDB.search_many
+        if hits is None:
+            search_width = top_k * multiplier if use_reranker else top_k
+            hits = self.db.get_response(query, search_width=search_width)
+
+        if use_reranker:
+            hits = self.rerank_many([query], [hits], top_k)[0]
+
+        return RAG_RESPONSE_PROMPT.format(context=format_context(hits), question=query)
+
+
+def format_context(hits: list[Hit]) -> str:
+    return dumps([hit.to_dict() for hit in resolve_payloads(hits)])
@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+import pymilvus as pym
+from pymilvus.milvus_client import IndexParams
+
+from utils import batched, dumps
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LocalVectorStore:
+    """In-process stand-in for the subset of pymilvus.MilvusClient that VectorDB uses.
+
+    Each collection is a directory holding an append-only float32 matrix of normalized vectors, the matching
+    int64 primary keys, a JSON-lines sidecar with the name and text of every row and a list of deleted rows.
+    Search is exact cosine similarity: a FAISS inner product index when faiss is installed, a batched matrix
+    product otherwise.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._collections: dict[str, _LocalCollection] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def prepare_index_params(field_name: str = "", **kwargs) -> IndexParams:
+        # Accepted for interface parity; search is always exact, so index parameters are ignored.
+        return pym.MilvusClient.prepare_index_params(field_name, **kwargs)
+
+    def has_collection(self, collection_name: str, **kwargs) -> bool:
+        return (self.path / collection_name / "meta.json").exists()
+
+    def create_collection(self, collection_name: str, dimension: int, **kwargs) -> None:
+        if self.has_collection(collection_name):
+            return
+        collection_path = self.path / collection_name
+        collection_path.mkdir(parents=True, exist_ok=True)
+        (collection_path / "meta.json").write_text(dumps({"dimension": dimension}))
+
+    def drop_collection(self, collection_name: str, **kwargs) -> None:
+        with self._lock:
+            self._collections.pop(collection_name, None)
+            shutil.rmtree(self.path / collection_name, ignore_errors=True)
+
+    def insert(self, collection_name: str, data: list[dict], **kwargs) -> dict:
+        self._collection(collection_name).insert(data)
+        return {"insert_count": len(data)}
+
+    def delete(self, collection_name: str, ids: list[int], **kwargs) -> dict:
+        return {"delete_count": self._collection(collection_name).delete(ids)}
+
+    def search(
+        self,
+        collection_name: str,
+        data: list,
+        limit: int = 10,
+        output_fields: list[str] | None = None,
+        **kwargs,
+    ) -> list[list[dict]]:
+        collection = self._collection(collection_name)
+        results = []
+        for rows, scores in collection.search(np.asarray(data, dtype=np.float32), limit):
+            results.append(
+                [
+                    {"id": collection.id_of(row), "distance": score, "entity": collection.payload(row, output_fields)}
+                    for row, score in zip(rows, scores)
+                ]
+            )
+        return results
+
+    def get(self, collection_name: str, ids: list[int], output_fields: list[str] | None = None, **kwargs) -> list:
+        collection = self._collection(collection_name)
+        return [
+            {"id": collection.id_of(row)} | collection.payload(row, output_fields) for row in collection.rows_of(ids)
+        ]
+
+    def query_iterator(self, collection_name: str, batch_size: int = 1000, **kwargs) -> "_ListIterator":
+        return _ListIterator([{"id": id} for id in self._collection(collection_name).ids()], batch_size)
+
+    def get_collection_stats(self, collection_name: str, **kwargs) -> dict:
+        return {"row_count": len(self._collection(collection_name))}
+
+    def flush(self, collection_name: str, **kwargs) -> None:
+        pass
+
+    def _collection(self, collection_name: str) -> "_LocalCollection":
+        with self._lock:
+            if collection_name not in self._collections:
+                if not self.has_collection(collection_name):
+                    raise ValueError(f"Collection {collection_name} does not exist")
+                self._collections[collection_name] = _LocalCollection(self.path / collection_name)
+            return self._collections[collection_name]
+
+
+class _LocalCollection:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.dimension = json.loads((path / "meta.json").read_text())["dimension"]
+        self._vectors_path = path / "vectors.f32"
+        self._ids_path = path / "ids.i64"
+        self._payloads_path = path / "payloads.jsonl"
+        self._deleted_path = path / "deleted.i64"
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def ids(self) -> list[int]:
+        return list(self._rows)
+
+    def id_of(self, row: int) -> int:
+        return int(self._ids[row])
+
+    def rows_of(self, ids: list[int]) -> list[int]:
+        return [self._rows[id] for id in ids if id in self._rows]
+
+    def payload(self, row: int, output_fields: list[str] | None) -> dict:
+        payload = self._payloads[row]
+        return payload if output_fields is None else {field: payload[field] for field in output_fields}
+
+    def insert(self, data: list[dict]) -> None:
+        vectors = np.asarray([row["vector"] for row in data], dtype=np.float32).reshape(-1, self.dimension)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        ids = np.asarray([row["id"] for row in data], dtype=np.int64)
+        payloads = [{field: row[field] for field in ("name", "text") if field in row} for row in data]
+        with self._lock:
+            # Inserting an existing primary key replaces the old row, mirroring an upsert.
+            self._mark_deleted(self.rows_of(ids.tolist()))
+            start = len(self._ids)
+            # Payloads and ids are written before the vectors, so a crash leaves rows that _load trims.
+            with open(self._payloads_path, "a", encoding="utf-8") as f:
+                f.write("".join(dumps(payload) + "\n" for payload in payloads))
+            with open(self._ids_path, "ab") as f:
+                f.write(ids.tobytes())
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            self._ids = np.concatenate([self._ids, ids])
+            self._payloads.extend(payloads)
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(data), dtype=bool)])
+            for offset, id in enumerate(ids.tolist()):
+                self._rows[id] = start + offset
+            self._matrix = None
+            self._index = None
+
+    def delete(self, ids: list[int]) -> int:
+        with self._lock:
+            rows = self.rows_of(ids)
+            self._mark_deleted(rows)
+            self._index = None
+        return len(rows)
+
+    def search(self, queries: np.ndarray, limit: int) -> list[tuple[list[int], list[float]]]:
+        queries = queries.reshape(-1, self.dimension)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            live_rows, index = self._get_index()
+        limit = min(limit, len(live_rows))
+        if limit == 0:
+            return [([], []) for _ in queries]
+
+        if faiss is not None:
+            scores, positions = index.search(np.ascontiguousarray(queries), limit)
+        else:
+            similarities = queries @ index.T
+            positions = np.argpartition(-similarities, limit - 1, axis=1)[:, :limit]
+            scores = np.take_along_axis(similarities, positions, axis=1)
+            order = np.argsort(-scores, axis=1)
+            positions = np.take_along_axis(positions, order, axis=1)
+            scores = np.take_along_axis(scores, order, axis=1)
+        return [(live_rows[p].tolist(), s.tolist()) for p, s in zip(positions, scores)]
+
+    def _get_index(self) -> tuple[np.ndarray, np.ndarray]:
+        # Live rows are gathered into a contiguous block once per change, so searches never skip tombstones.
+        if self._index is None:
+            live_rows = np.flatnonzero(~self._deleted)
+            live_vectors = np.ascontiguousarray(self._get_matrix()[live_rows])
+            if faiss is not None:
+                index = faiss.IndexFlatIP(self.dimension)
+                index.add(live_vectors)
+            else:
+                index = live_vectors
+            self._index = (live_rows, index)
+        return self._index
+
+    def _get_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            if len(self._ids):
+                self._matrix = np.memmap(
+                    self._vectors_path, dtype=np.float32, mode="r", shape=(len(self._ids), self.dimension)
+                )
+            else:
+                self._matrix = np.empty((0, self.dimension), dtype=np.float32)
+        return self._matrix
+
+    def _mark_deleted(self, rows: list[int]) -> None:
+        if not rows:
+            return
+        with open(self._deleted_path, "ab") as f:
+            f.write(np.asarray(rows, dtype=np.int64).tobytes())
+        self._deleted[rows] = True
+        for row in rows:
+            del self._rows[int(self._ids[row])]
+
+    def _load(self) -> None:
+        row_size = self.dimension * np.dtype(np.float32).itemsize
+        vectors_size = self._vectors_path.stat().st_size if self._vectors_path.exists() else 0
+        ids = np.fromfile(self._ids_path, dtype=np.int64) if self._ids_path.exists() else np.empty(0, np.int64)
+        num_rows = min(vectors_size // row_size, len(ids))
+        self._payloads = []
+        payload_offsets = [0]
+        if self._payloads_path.exists():
+            with open(self._payloads_path, "rb") as f:
+                for line in f:
+                    if len(self._payloads) == num_rows or not line.endswith(b"\n"):
+                        break
+                    self._payloads.append(json.loads(line))
+                    payload_offsets.append(payload_offsets[-1] + len(line))
+        num_rows = min(num_rows, len(self._payloads))
+        self._payloads = self._payloads[:num_rows]
+
+        # Rows past the shortest file come from an interrupted insert and are cut so later appends stay aligned.
+        sizes = {
+            self._vectors_path: num_rows * row_size,
+            self._ids_path: num_rows * ids.itemsize,
+            self._payloads_path: payload_offsets[num_rows],
+        }
+        for path, size in sizes.items():
+            if path.exists() and path.stat().st_size != size:
+                logger.warning(f"Trimming {path} to {num_rows} consistent rows")
+                os.truncate(path, size)
+
+        self._ids = ids[:num_rows]
+        self._deleted = np.zeros(num_rows, dtype=bool)
+        if self._deleted_path.exists():
+            deleted = np.fromfile(self._deleted_path, dtype=np.int64)
+            self._deleted[deleted[deleted < num_rows]] = True
+        self._rows = {int(self._ids[row]): int(row) for row in np.flatnonzero(~self._deleted)}
+        self._matrix = None
+        self._index = None
+        logger.info(f"Loaded {len(self._rows)} sections from {self.path}")
+
+
+class _ListIterator:
+    """Mimics the batches returned by MilvusClient.query_iterator."""
+
+    def __init__(self, rows: list[dict], batch_size: int) -> None:
+        self._batches = iter(batched(rows, batch_size))
+
+    def next(self) -> list[dict]:
+        return next(self._batches, [])
+
+    def close(self) -> None:
+        pass
@@ -4,16 +4,20 @@ import random
 import time
 
 from openai import AsyncOpenAI
-from pymilvus import MilvusClient
 
+from bm25 import BM25Index
+from cache import ResponseCache
 from comparison import RAGComparison, RetrievalComparison
 from cross_encoder import CrossEncoder
 from download import EurlexDownloader
 from embedding import EmbeddingModel
 from evaluation import EvaluationDatasetGenerator
+from rate_limit import RateLimiter
 from settings import Settings
+from text_store import TextStore
 from utils import (
     DEFAULT_EURLEX_URL,
+    DEFAULT_EVAL_CHECKPOINT_FILE,
     DEFAULT_EVAL_FILE,
     DEFAULT_RAG_COMPARISON_FILE,
     DEFAULT_RETRIEVAL_COMPARISON_FILE,
@@ -21,7 +25,7 @@ from utils import (
     load_json,
     save_json,
 )
-from vector_db import VectorDB
+from vector_db import VectorDB, create_vector_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -41,7 +45,14 @@ async def main():
     # 0. Load settings from environment variables
     settings = Settings()
 
-    openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
+    # Retries are handled by call_llm, which backs off with jitter and honours the rate limiter.
+    openai_client = AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url, max_retries=0)
+    limiter = RateLimiter(
+        max_concurrency=settings.llm_max_concurrency,
+        requests_per_minute=settings.llm_requests_per_minute,
+        tokens_per_minute=settings.llm_tokens_per_minute,
+    )
+    response_cache = ResponseCache(settings.llm_cache_path) if settings.llm_cache_enabled else None
 
     # 1. Download data from EUR-Lex and save it to a file
     if not os.path.exists(DEFAULT_SAVE_FILE):
@@ -51,11 +62,28 @@ async def main():
     data = load_json(DEFAULT_SAVE_FILE)
 
     # 2. Create a vector database from the downloaded data
-    embedding_model = EmbeddingModel(settings.embedding_model)
-    milvus_client = MilvusClient(uri=settings.milvus_uri, token=settings.milvus_token)
-    vector_db = VectorDB(embedding_model=embedding_model, milvus_client=milvus_client)
-    if not vector_db.collection_exists():
-        vector_db.create_collection_from_documents(documents=data, drop_existing=True)
+    embedding_model = EmbeddingModel(
+        settings.embedding_model,
+        batch_size=settings.embedding_batch_size,
+        cache_dir=settings.embedding_cache_dir,
+        query_cache_size=settings.query_cache_size,
+        query_cache_ttl=settings.query_cache_ttl,
+        num_workers=settings.embedding_workers,
+        threads_per_worker=settings.embedding_threads_per_worker,
+    )
+    milvus_client = create_vector_client(settings)
+    vector_db = VectorDB(
+        embedding_model=embedding_model,
+        milvus_client=milvus_client,
+        result_cache_size=settings.result_cache_size,
+        sparse_index=BM25Index(settings.sparse_index_path) if settings.retrieval_mode == "hybrid" else None,
+        index_profile=settings.milvus_index_profile,
+        vector_dtype=settings.vector_dtype,
+        rescore_multiplier=settings.rescore_multiplier,
+        text_store=TextStore(settings.text_store_dir) if settings.payload_mode == "lazy" else None,
+    )
+    vector_db.sync_collection_from_documents(documents=data)
+    embedding_model.close()
 
     # 3. Generate questions and answers
     if not os.path.exists(DEFAULT_EVAL_FILE):
@@ -64,8 +92,12 @@ async def main():
             openai_client=openai_client,
             context_list=selected_docs,
             model_name=settings.llm_model,
+            limiter=limiter,
+            num_workers=settings.llm_max_concurrency,
+            response_cache=response_cache,
+            critique_mode=settings.critique_mode,
         )
-        await eval_test(file_path=DEFAULT_EVAL_FILE)
+        await eval_test(file_path=DEFAULT_EVAL_FILE, checkpoint_path=DEFAULT_EVAL_CHECKPOINT_FILE)
 
     # 4. Load eval dataset
     eval_dataset = load_json(DEFAULT_EVAL_FILE)
@@ -73,23 +105,32 @@ async def main():
     # 5. Create a cross-encoder
     cross_encoder = CrossEncoder(
         settings.cross_encoder_model,
+        batch_size=settings.cross_encoder_batch_size,
+        window_aggregation=settings.cross_encoder_window_aggregation,
+        max_length=settings.cross_encoder_max_length,
+        backend=settings.cross_encoder_backend,
+        score_cache_size=settings.rerank_cache_size,
+        score_cache_path=settings.rerank_cache_path,
+        cascade_model=settings.rerank_cascade_model,
+        cascade_multiplier=settings.rerank_cascade_multiplier,
     )
 
     # 6. Run Retrieval Comparison
     start_time = time.time()
-    for top_k in [3, 5, 10, 15]:
-        start_time = time.time()
-        retrieval_comparison = RetrievalComparison(
-            dataset=eval_dataset,
-            cross_encoder=cross_encoder,
-            vector_db=vector_db,
-        )
-        result = retrieval_comparison(top_k=top_k)
+    top_k_values = [3, 5, 10, 15]
+    retrieval_comparison = RetrievalComparison(
+        dataset=eval_dataset,
+        cross_encoder=cross_encoder,
+        vector_db=vector_db,
+    )
+    results, timing = retrieval_comparison.sweep(top_k_values=top_k_values)
+    for top_k, result in results.items():
         save_json(
             result,
             DEFAULT_RETRIEVAL_COMPARISON_FILE.replace(".json", f"_top_{top_k}.json"),
         )
-        logger.info(f"Retrieval comparison time: {time.time() - start_time} seconds for top_k={top_k}")
+    save_json(timing, DEFAULT_RETRIEVAL_COMPARISON_FILE.replace(".json", "_sweep_timing.json"))
+    logger.info(f"Retrieval comparison time: {time.time() - start_time} seconds for top_k={top_k_values}")
 
     # 7. Run RAG evaluation
     start_time = time.time()
@@ -99,10 +140,14 @@ async def main():
         vector_db=vector_db,
         cross_encoder=cross_encoder,
         model_name=settings.llm_model,
+        limiter=limiter,
+        response_cache=response_cache,
     )
     result = await rag_evaluation()
     logger.info(f"RAG evaluation time: {time.time() - start_time} seconds")
     save_json(result, DEFAULT_RAG_COMPARISON_FILE)
+    if response_cache is not None:
+        logger.info(f"LLM response cache: {response_cache.stats()}")
 
 
 if __name__ == "__main__":
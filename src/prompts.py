@@ -95,6 +95,32 @@ Question: {question}
 Answer:::
 """
 
+QA_CRITIQUE_COMBINED = """
+You will be given a context and a question generated from it, for a dataset of questions about European legal or regulatory texts (e.g., directives, regulations, or case law from EUR-Lex), especially those relevant to industrial contexts.
+Rate the question on three criteria, each on a scale from 1 to 5:
+
+- groundedness: how well one can answer the question unambiguously with the given context.
+  1 means the question is not answerable at all given the context, 5 means it is clearly and unambiguously answerable with the context.
+- relevance: how useful the question is for machine learning applications that process or generate outputs based on legal and regulatory documents from EUR-Lex (e.g., safety compliance, product standards, environmental regulations).
+  Questions that refer to specific directives, legal requirements, obligations, definitions, or rights are generally more useful. Vague, overly general, or off-topic questions should receive a lower score.
+  For example, "What obligations does the manufacturer have under Regulation (EU) 2019/1020?" is likely a 5, while "What do they mean?" is likely a 1.
+- standalone: how context-independent the question is.
+  1 means the question heavily depends on external context or document references to be understood, 5 means it is fully self-contained.
+  Legal or technical terms (e.g., 'CE marking', 'harmonised standard', 'REACH regulation') may appear in well-formed standalone questions, as long as the intent of the question is clear to someone familiar with EU legal language and access to documentation.
+  For example, "What are the essential requirements under Directive 2014/35/EU?" should receive a 5, while "What are they according to the document?" should receive a 1.
+
+Respond with a single JSON object and nothing else, in exactly this shape:
+{{"groundedness": {{"evaluation": "(your rationale, as a text)", "rating": (a number between 1 and 5)}}, "relevance": {{"evaluation": "(your rationale, as a text)", "rating": (a number between 1 and 5)}}, "standalone": {{"evaluation": "(your rationale, as a text)", "rating": (a number between 1 and 5)}}}}
+
+Now here are the question and context.
+
+Question: {question}
+
+Context: {context}
+
+JSON:
+"""
+
 EVALUATION_PROMPT = """###Task Description:
 An instruction (might include an Input inside it), a response to evaluate, a reference answer that gets a score of 5, and a score rubric representing a evaluation criteria are given.
 1. Write a detailed feedback that assess the quality of the response strictly based on the given score rubric, not evaluating in general.
@@ -0,0 +1,70 @@
+import asyncio
+import contextvars
+import time
+from contextlib import asynccontextmanager
+
+# Seconds the current task has spent queued in a RateLimiter, so callers can separate latency from throttling.
+limiter_wait: contextvars.ContextVar[list[float] | None] = contextvars.ContextVar("limiter_wait", default=None)
+
+
+class TokenBucket:
+    """Refills continuously at `rate_per_minute` units up to one minute's worth of burst."""
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.level = rate_per_minute
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float) -> None:
+        # A request larger than the bucket could never be served, so it waits for a full bucket instead.
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """Charge (positive) or refund (negative) units once the real cost of a request is known."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RateLimiter:
+    """Caps concurrent LLM calls and keeps requests and tokens per minute under the account limits."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+    ) -> None:
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    @asynccontextmanager
+    async def limit(self, tokens: int = 0):
+        start_time = time.monotonic()
+        async with self._semaphore:
+            if self._requests is not None:
+                await self._requests.acquire(1)
+            if self._tokens is not None:
+                await self._tokens.acquire(tokens)
+            waited = limiter_wait.get()
+            if waited is not None:
+                waited[0] += time.monotonic() - start_time
+            yield
+
+    def record_tokens(self, estimated: int, actual: int) -> None:
+        if self._tokens is not None:
+            self._tokens.adjust(actual - estimated)
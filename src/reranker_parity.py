@@ -0,0 +1,95 @@
+import argparse
+import time
+
+import numpy as np
+
+from cross_encoder import CrossEncoder
+from embedding import EmbeddingModel
+from settings import Settings
+from text_store import TextStore
+from utils import DEFAULT_EVAL_FILE, load_json, save_json
+from vector_db import VectorDB, create_vector_client
+
+DEFAULT_PARITY_FILE = "./data/reranker_parity.json"
+
+
+def _ranks(scores: list[float]) -> np.ndarray:
+    ranks = np.empty(len(scores))
+    ranks[np.argsort(scores)] = np.arange(len(scores))
+    return ranks
+
+
+def compare_rankings(
+    reference_scores: list[list[float]],
+    candidate_scores: list[list[float]],
+    top_k: int = 10,
+) -> dict[str, float]:
+    """Measure how far a candidate backend's rankings drift from the reference fp32 model."""
+    overlaps, top_1, spearman, max_diffs = [], [], [], []
+    for reference, candidate in zip(reference_scores, candidate_scores):
+        if len(reference) < 2:
+            continue
+        reference_top = set(np.argsort(reference)[::-1][:top_k])
+        candidate_top = set(np.argsort(candidate)[::-1][:top_k])
+        overlaps.append(len(reference_top & candidate_top) / len(reference_top))
+        top_1.append(float(np.argmax(reference) == np.argmax(candidate)))
+        spearman.append(float(np.corrcoef(_ranks(reference), _ranks(candidate))[0, 1]))
+        max_diffs.append(float(np.max(np.abs(np.asarray(reference) - np.asarray(candidate)))))
+    if not overlaps:
+        raise ValueError("Rankings need at least one query with two or more scored candidates to compare")
+    return {
+        f"top_{top_k}_overlap": float(np.mean(overlaps)),
+        "top_1_agreement": float(np.mean(top_1)),
+        "spearman": float(np.mean(spearman)),
+        "max_abs_score_diff": float(np.max(max_diffs)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check reranker backend parity against the fp32 torch model.")
+    parser.add_argument("--backend", choices=["torch-int8", "onnx"], default="torch-int8")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--multiplier", type=int, default=5)
+    args = parser.parse_args()
+
+    settings = Settings()
+    embedding_model = EmbeddingModel(settings.embedding_model, cache_dir=settings.embedding_cache_dir)
+    milvus_client = create_vector_client(settings)
+    vector_db = VectorDB(
+        embedding_model=embedding_model,
+        milvus_client=milvus_client,
+        vector_dtype=settings.vector_dtype,
+        rescore_multiplier=settings.rescore_multiplier,
+        text_store=TextStore(settings.text_store_dir) if settings.payload_mode == "lazy" else None,
+    )
+
+    questions = [item["question"] for item in load_json(DEFAULT_EVAL_FILE)]
+    candidate_lists = vector_db.search_many(questions, limit=args.top_k * args.multiplier)
+
+    timings = {}
+    scores = {}
+    for backend in ["torch", args.backend]:
+        cross_encoder = CrossEncoder(
+            settings.cross_encoder_model,
+            batch_size=settings.cross_encoder_batch_size,
+            window_aggregation=settings.cross_encoder_window_aggregation,
+            max_length=settings.cross_encoder_max_length,
+            backend=backend,
+        )
+        start_time = time.time()
+        scores[backend] = cross_encoder.score_many(questions, candidate_lists)
+        timings[backend] = (time.time() - start_time) / len(questions)
+
+    report = compare_rankings(scores["torch"], scores[args.backend], top_k=args.top_k)
+    report["avg_time"] = timings
+    report["speedup"] = timings["torch"] / timings[args.backend]
+    report["backend"] = args.backend
+    save_json(report, DEFAULT_PARITY_FILE)
+
+    print(f"\n=== Reranker parity: {args.backend} vs torch ===")
+    for key, value in report.items():
+        print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,185 @@
-from pydantic import Field
+from typing import Literal, get_args
+
+from pydantic import Field, ValidationInfo, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from utils import (
+    DEFAULT_EMBEDDING_CACHE_DIR,
+    DEFAULT_LLM_CACHE_FILE,
+    DEFAULT_LOCAL_VECTOR_STORE_DIR,
+    DEFAULT_RERANK_CACHE_FILE,
+    DEFAULT_SPARSE_INDEX_FILE,
+    DEFAULT_TEXT_STORE_DIR,
+)
+
 
 class Settings(BaseSettings):
     llm_model: str = Field(..., alias="LLM_MODEL", description="Language model to use for generation")
     openai_api_key: str = Field(..., alias="OPENAI_API_KEY", description="OpenAI API key for authentication")
+    openai_base_url: str | None = Field(
+        default=None,
+        alias="OPENAI_BASE_URL",
+        description="OpenAI-compatible endpoint, e.g. a local stub server for tests",
+    )
+    llm_cache_enabled: bool = Field(
+        default=True,
+        alias="LLM_CACHE_ENABLED",
+        description="Reuse stored LLM responses for prompts that were already sent to the same model",
+    )
+    llm_cache_path: str = Field(
+        default=DEFAULT_LLM_CACHE_FILE,
+        alias="LLM_CACHE_PATH",
+        description="SQLite file holding cached LLM responses",
+    )
+    critique_mode: Literal["combined", "separate"] = Field(
+        default="combined",
+        alias="CRITIQUE_MODE",
+        description="Rate generated questions on all criteria in one call, or with one call per criterion",
+    )
+    llm_max_concurrency: int = Field(
+        default=16,
+        alias="LLM_MAX_CONCURRENCY",
+        description="Maximum number of LLM requests in flight",
+    )
+    llm_requests_per_minute: int = Field(
+        default=500,
+        alias="LLM_REQUESTS_PER_MINUTE",
+        description="Request rate limit for LLM calls (0 disables it)",
+    )
+    llm_tokens_per_minute: int = Field(
+        default=200_000,
+        alias="LLM_TOKENS_PER_MINUTE",
+        description="Token rate limit for LLM calls (0 disables it)",
+    )
     embedding_model: str = Field(..., alias="EMBEDDING_MODEL", description="Model name for text embeddings")
-    milvus_uri: str = Field(..., alias="MILVUS_URI", description="Milvus database URI")
+    embedding_batch_size: int = Field(
+        default=64,
+        alias="EMBEDDING_BATCH_SIZE",
+        description="Number of sections encoded per forward pass",
+    )
+    embedding_workers: int = Field(
+        default=0,
+        alias="EMBEDDING_WORKERS",
+        description="Number of CPU worker processes used for corpus embedding (0 disables the pool)",
+    )
+    embedding_threads_per_worker: int | None = Field(
+        default=None,
+        alias="EMBEDDING_THREADS_PER_WORKER",
+        description="Torch threads per embedding worker, defaults to an even split of the available logical CPUs "
+        "(hyperthreads included)",
+    )
+    embedding_cache_dir: str | None = Field(
+        default=DEFAULT_EMBEDDING_CACHE_DIR,
+        alias="EMBEDDING_CACHE_DIR",
+        description="Directory of the persistent embedding cache, empty to disable it",
+    )
+    query_cache_size: int = Field(
+        default=1024,
+        alias="QUERY_CACHE_SIZE",
+        description="Maximum number of query embeddings kept in memory (0 disables the cache)",
+    )
+    query_cache_ttl: float | None = Field(
+        default=3600.0,
+        alias="QUERY_CACHE_TTL",
+        description="Seconds a cached query embedding stays valid, empty for no expiry",
+    )
+    result_cache_size: int = Field(
+        default=4096,
+        alias="RESULT_CACHE_SIZE",
+        description="Maximum number of cached search results (0 disables the cache)",
+    )
+    retrieval_mode: Literal["dense", "hybrid"] = Field(
+        default="dense",
+        alias="RETRIEVAL_MODE",
+        description="Dense vector search only, or dense plus BM25 fused with reciprocal rank fusion",
+    )
+    sparse_index_path: str = Field(
+        default=DEFAULT_SPARSE_INDEX_FILE,
+        alias="SPARSE_INDEX_PATH",
+        description="SQLite file holding the BM25 index used by hybrid retrieval",
+    )
+    milvus_index_profile: Literal["autoindex", "flat", "hnsw", "ivf_flat", "ivf_pq", "diskann"] = Field(
+        default="autoindex",
+        alias="MILVUS_INDEX_PROFILE",
+        description="ANN index profile used when the laws collection is created",
+    )
+    vector_backend: Literal["milvus", "local"] = Field(
+        default="milvus",
+        alias="VECTOR_BACKEND",
+        description="Milvus server, or the embedded NumPy/FAISS store that needs no external services",
+    )
+    local_vector_store_dir: str = Field(
+        default=DEFAULT_LOCAL_VECTOR_STORE_DIR,
+        alias="LOCAL_VECTOR_STORE_DIR",
+        description="Directory holding the collections of the local vector backend",
+    )
+    vector_dtype: Literal["float32", "float16", "bfloat16", "binary"] = Field(
+        default="float32",
+        alias="VECTOR_DTYPE",
+        description="Element type of the stored vectors; anything but float32 is re-scored in float32",
+    )
+    rescore_multiplier: int = Field(
+        default=4,
+        alias="RESCORE_MULTIPLIER",
+        description="Shortlist size, as a multiple of the requested hits, re-scored for reduced-precision vectors",
+    )
+    payload_mode: Literal["inline", "lazy"] = Field(
+        default="inline",
+        alias="PAYLOAD_MODE",
+        description="Store section texts in the collection, or in a side store fetched only for surviving hits",
+    )
+    text_store_dir: str = Field(
+        default=DEFAULT_TEXT_STORE_DIR,
+        alias="TEXT_STORE_DIR",
+        description="Directory of the side store holding section names and texts in lazy payload mode",
+    )
+    milvus_uri: str = Field(default="http://localhost:19530", alias="MILVUS_URI", description="Milvus database URI")
     milvus_token: str = Field(default="", alias="MILVUS_TOKEN", description="Milvus database token")
     cross_encoder_model: str = Field(
         ...,
         alias="CROSS_ENCODER_MODEL",
         description="Cross-encoder model for reranking",
     )
+    cross_encoder_batch_size: int = Field(
+        default=64,
+        alias="CROSS_ENCODER_BATCH_SIZE",
+        description="Number of query/passage pairs scored per forward pass",
+    )
+    cross_encoder_backend: Literal["torch", "torch-int8", "onnx"] = Field(
+        default="torch",
+        alias="CROSS_ENCODER_BACKEND",
+        description="Reranker runtime: full torch, dynamic int8 quantized torch or ONNX Runtime",
+    )
+    rerank_cache_size: int = Field(
+        default=100_000,
+        alias="RERANK_CACHE_SIZE",
+        description="Maximum number of reranker scores kept in memory (0 disables the memory tier)",
+    )
+    rerank_cache_path: str | None = Field(
+        default=DEFAULT_RERANK_CACHE_FILE,
+        alias="RERANK_CACHE_PATH",
+        description="SQLite file backing the reranker score cache, empty to keep scores in memory only",
+    )
+    rerank_cascade_model: str | None = Field(
+        default=None,
+        alias="RERANK_CASCADE_MODEL",
+        description="Cheap first-stage scorer ('bm25' or a small cross-encoder) that prunes candidates",
+    )
+    rerank_cascade_multiplier: int = Field(
+        default=2,
+        alias="RERANK_CASCADE_MULTIPLIER",
+        description="First-stage survivors per query, as a multiple of top_k",
+    )
+    cross_encoder_max_length: int = Field(
+        default=512,
+        alias="CROSS_ENCODER_MAX_LENGTH",
+        description="Token budget of one query/passage pair; longer passages are truncated or split into windows",
+    )
+    cross_encoder_window_aggregation: Literal["max", "mean"] | None = Field(
+        default=None,
+        alias="CROSS_ENCODER_WINDOW_AGGREGATION",
+        description="Score long passages as overlapping token windows aggregated with max or mean",
+    )
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -21,3 +188,16 @@ class Settings(BaseSettings):
         env_prefix="",
         extra="ignore",
     )
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _empty_as_none(cls, value, info: ValidationInfo):
+        # "KEY=" in .env is the natural way to switch an optional setting off, whatever its type. Fields that
+        # cannot be None keep the empty value and fail validation as before.
+        if (
+            isinstance(value, str)
+            and not value.strip()
+            and type(None) in get_args(cls.model_fields[info.field_name].annotation)
+        ):
+            return None
+        return value
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+
+from utils import dumps
+
+# One record per section, sorted by id: the law name is an index into the name table and the text a slice of the blob.
+_RECORD = np.dtype([("id", np.int64), ("name", np.int32), ("offset", np.int64), ("length", np.int32)])
+
+
+class TextStore:
+    """Section names and texts kept outside the vector collection and fetched by id only when needed.
+
+    Law names repeat for every section of a law, so they live once in a name table. Texts are appended to a
+    single UTF-8 blob and located through an id-sorted offset index; removed sections leave their bytes behind
+    until the store is cleared.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._names_path = self.path / "names.json"
+        self._index_path = self.path / "index.npy"
+        self._blob_path = self.path / "texts.bin"
+        self._lock = threading.Lock()
+        self._names: list[str] = json.loads(self._names_path.read_text()) if self._names_path.exists() else []
+        self._name_ids = {name: i for i, name in enumerate(self._names)}
+        self._index = np.load(self._index_path) if self._index_path.exists() else np.empty(0, dtype=_RECORD)
+        self._blob: np.memmap | None = None
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def ids(self) -> set[int]:
+        return set(self._index["id"].tolist())
+
+    def add_many(self, sections: Iterable[dict]) -> None:
+        with self._lock:
+            known = self.ids()
+            sections = {section["id"]: section for section in sections if section["id"] not in known}
+            if not sections:
+                return
+            records = np.empty(len(sections), dtype=_RECORD)
+            texts = []
+            offset = self._blob_path.stat().st_size if self._blob_path.exists() else 0
+            for record, (id, section) in zip(records, sections.items()):
+                text = section["text"].encode("utf-8")
+                record["id"] = id
+                record["name"] = self._name_id(section["name"])
+                record["offset"] = offset
+                record["length"] = len(text)
+                texts.append(text)
+                offset += len(text)
+            # The blob and name table are extended before the index that points into them is replaced.
+            with open(self._blob_path, "ab") as f:
+                f.write(b"".join(texts))
+            _write_atomic(self._names_path, dumps(self._names).encode("utf-8"))
+            index = np.concatenate([self._index, records])
+            self._save_index(index[np.argsort(index["id"], kind="stable")])
+
+    def remove_many(self, ids: list[int]) -> None:
+        with self._lock:
+            self._save_index(self._index[~np.isin(self._index["id"], np.asarray(ids, dtype=np.int64))])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._save_index(np.empty(0, dtype=_RECORD))
+            self._names, self._name_ids = [], {}
+            self._names_path.unlink(missing_ok=True)
+            self._blob_path.unlink(missing_ok=True)
+
+    def get_many(self, ids: list[int]) -> dict[int, tuple[str, str]]:
+        """Look up (name, text) for the given ids; ids that are not stored are left out."""
+        index = self._index
+        if not ids or not len(index):
+            return {}
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(index["id"], ids), len(index) - 1)
+        blob = self._get_blob()
+        payloads = {}
+        for record in index[positions[index["id"][positions] == ids]]:
+            offset = int(record["offset"])
+            text = blob[offset : offset + int(record["length"])].tobytes().decode("utf-8")
+            payloads[int(record["id"])] = (self._names[record["name"]], text)
+        return payloads
+
+    def _name_id(self, name: str) -> int:
+        if name not in self._name_ids:
+            self._name_ids[name] = len(self._names)
+            self._names.append(name)
+        return self._name_ids[name]
+
+    def _save_index(self, index: np.ndarray) -> None:
+        with open(self._index_path.with_suffix(".tmp"), "wb") as f:
+            np.save(f, index)
+        os.replace(self._index_path.with_suffix(".tmp"), self._index_path)
+        self._index = index
+        self._blob = None
+
+    def _get_blob(self) -> np.memmap | np.ndarray:
+        if self._blob is None:
+            size = self._blob_path.stat().st_size if self._blob_path.exists() else 0
+            # np.memmap refuses empty files.
+            self._blob = np.memmap(self._blob_path, dtype=np.uint8, mode="r") if size else np.empty(0, np.uint8)
+        return self._blob
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
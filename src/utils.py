@@ -1,19 +1,43 @@
 import json
+import os
+from collections.abc import Iterable, Iterator
+from itertools import islice
 from os.path import exists
-from typing import Literal
+from typing import Literal, TypeVar
 
 import torch
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 DEFAULT_EURLEX_URL = "https://eur-lex.europa.eu/search.html?lang=en&text=industry&qid=1742919459451&type=quick&DTS_SUBDOM=LEGISLATION&scope=EURLEX&FM_CODED=REG"
 
 DEFAULT_SAVE_FILE = "./data/scraped_data.json"
 
 DEFAULT_EVAL_FILE = "./data/evaluation_results.json"
 
+DEFAULT_EVAL_CHECKPOINT_FILE = "./data/evaluation_checkpoint.jsonl"
+
 DEFAULT_RETRIEVAL_COMPARISON_FILE = "./data/retrieval_comparison.json"
 
 DEFAULT_RAG_COMPARISON_FILE = "./data/rag_comparison.json"
 
+DEFAULT_EMBEDDING_CACHE_DIR = "./data/embedding_cache"
+
+DEFAULT_RERANK_CACHE_FILE = "./data/rerank_scores.sqlite"
+
+DEFAULT_LLM_CACHE_FILE = "./data/llm_responses.sqlite"
+
+DEFAULT_SPARSE_INDEX_FILE = "./data/sparse_index.sqlite"
+
+DEFAULT_LOCAL_VECTOR_STORE_DIR = "./data/vector_store"
+
+DEFAULT_TEXT_STORE_DIR = "./data/text_store"
+
+T = TypeVar("T")
+
 
 def get_device() -> Literal["cuda", "mps", "cpu"]:
     if torch.cuda.is_available():
@@ -24,10 +48,27 @@ def get_device() -> Literal["cuda", "mps", "cpu"]:
         return "cpu"
 
 
-def truncate(text: str, max_length: int = 512) -> str:
-    if len(text) > max_length:
-        return text[:max_length]
-    return text
+def available_cpus() -> int:
+    """Logical CPUs this process may run on, hyperthreads included, honouring affinity masks where supported."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+
+def dumps(data: list | dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False)
 
 
 def load_json(path: str) -> list | dict:
@@ -1,53 +1,251 @@
-import json
+import hashlib
+import heapq
 import logging
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 
+import numpy as np
 import pymilvus as pym
 
+from bm25 import BM25Index
+from cache import LRUCache
 from embedding import EmbeddingModel
+from local_store import LocalVectorStore
+from settings import Settings
+from text_store import TextStore
+from utils import batched
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class Hit:
+    id: int
+    score: float
+    name: str | None = None
+    text: str | None = None
+    # Set while the payload still sits in a side store; resolve_payloads fetches it in bulk.
+    store: TextStore | None = field(default=None, repr=False, compare=False)
+
+    def to_dict(self) -> dict[str, str]:
+        return {"name": self.name, "text": self.text}
+
+
+PQ_DIMENSIONS_PER_SUBVECTOR = 8
+
+
+@dataclass(frozen=True)
+class IndexProfile:
+    index_type: str
+    params: dict
+    search_params: dict
+
+    def build_params(self, dimension: int) -> dict:
+        """Index build parameters for vectors of the given dimension."""
+        if self.index_type != "IVF_PQ":
+            return self.params
+        if "m" in self.params:
+            if dimension % self.params["m"]:
+                raise ValueError(f"IVF_PQ needs m to divide the dimension, got m={self.params['m']} for {dimension}")
+            return self.params
+        # PQ splits each vector into m equal sub-vectors. About eight dimensions per sub-vector balances recall
+        # against code size, so m is the largest divisor of the dimension up to dimension / 8.
+        target = max(1, dimension // PQ_DIMENSIONS_PER_SUBVECTOR)
+        m = max(divisor for divisor in range(1, target + 1) if dimension % divisor == 0)
+        return self.params | {"m": m}
+
+
+INDEX_PROFILES = {
+    "autoindex": IndexProfile("AUTOINDEX", {}, {}),
+    "flat": IndexProfile("FLAT", {}, {}),
+    "hnsw": IndexProfile("HNSW", {"M": 16, "efConstruction": 200}, {"ef": 64}),
+    "ivf_flat": IndexProfile("IVF_FLAT", {"nlist": 1024}, {"nprobe": 16}),
+    "ivf_pq": IndexProfile("IVF_PQ", {"nlist": 1024, "nbits": 8}, {"nprobe": 16}),
+    "diskann": IndexProfile("DISKANN", {}, {"search_list": 100}),
+}
+
+VECTOR_DTYPES = {
+    "float32": pym.DataType.FLOAT_VECTOR,
+    "float16": pym.DataType.FLOAT16_VECTOR,
+    "bfloat16": pym.DataType.BFLOAT16_VECTOR,
+    "binary": pym.DataType.BINARY_VECTOR,
+}
+
+# Binary vectors only support the BIN_* flavours of brute force and IVF search.
+BINARY_INDEX_TYPES = {"AUTOINDEX": "AUTOINDEX", "FLAT": "BIN_FLAT", "IVF_FLAT": "BIN_IVF_FLAT"}
+
+
 class VectorDB:
-    def __init__(self, embedding_model: EmbeddingModel, milvus_client: pym.MilvusClient) -> None:
+    def __init__(
+        self,
+        embedding_model: EmbeddingModel,
+        milvus_client: pym.MilvusClient | LocalVectorStore,
+        result_cache_size: int = 4096,
+        sparse_index: BM25Index | None = None,
+        rrf_k: int = 60,
+        index_profile: str = "autoindex",
+        collection_name: str = "laws",
+        vector_dtype: str = "float32",
+        rescore_multiplier: int = 4,
+        text_store: TextStore | None = None,
+    ) -> None:
         self.milvus_client = milvus_client
         self.embedding_model = embedding_model
-        self.collection_name = "laws"
+        self.collection_name = collection_name
+        self.index_profile = INDEX_PROFILES[index_profile]
+        self.vector_dtype = vector_dtype
+        self.metric_type = "HAMMING" if vector_dtype == "binary" else "COSINE"
+        if vector_dtype == "binary":
+            if self.index_profile.index_type not in BINARY_INDEX_TYPES:
+                raise ValueError(f"Index profile {index_profile} does not support binary vectors")
+            self.index_profile = replace(
+                self.index_profile, index_type=BINARY_INDEX_TYPES[self.index_profile.index_type]
+            )
+        if vector_dtype != "float32" and isinstance(milvus_client, LocalVectorStore):
+            raise ValueError("The local vector backend only stores float32 vectors")
+        if vector_dtype != "float32" and embedding_model.cache is None:
+            # Without it, every search would re-embed the whole shortlist and cost more than it saves.
+            raise ValueError(f"{vector_dtype} vectors are re-scored from the embedding cache; set EMBEDDING_CACHE_DIR")
+        # Reduced-precision collections return a wider shortlist that is re-scored with the float32 embeddings.
+        self.rescore_multiplier = rescore_multiplier if vector_dtype != "float32" else 1
+        # With a text store the collection only holds ids and vectors, and hits carry their payload lazily.
+        self.text_store = text_store
+        self.output_fields = [] if text_store is not None else ["text", "name"]
+        self.result_cache = LRUCache(maxsize=result_cache_size)
+        # With a sparse index, retrieval is hybrid: dense and BM25 rankings are merged with reciprocal rank fusion.
+        self.sparse_index = sparse_index
+        self.rrf_k = rrf_k
+
+    def get_response(self, prompt: str, search_width: int = 10) -> list[Hit]:
+        try:
+            vector_prompt = self.embedding_model.encode_queries([prompt])[0]
+            return self._retrieve([prompt], [vector_prompt], search_width)[0]
+        except Exception as e:
+            logger.error(f"Error during vector search: {e}")
+            raise
 
-    def get_response(self, prompt: str, search_width: int = 10) -> tuple[list, str]:
+    def search_many(self, queries: list[str], limit: int = 10, batch_size: int = 32) -> list[list[Hit]]:
         try:
-            vector_prompt = self.embedding_model.model.encode(prompt)
+            vectors = self.embedding_model.encode_queries(queries)
+            results = []
+            for start in range(0, len(queries), batch_size):
+                end = start + batch_size
+                results.extend(self._retrieve(queries[start:end], vectors[start:end], limit))
+            return results
+        except Exception as e:
+            logger.error(f"Error during batched vector search: {e}")
+            raise
+
+    def _retrieve(self, queries: list[str], vectors: list, limit: int) -> list[list[Hit]]:
+        dense_results = self._search(vectors, limit)
+        if self.sparse_index is None:
+            return dense_results
 
-            query_vector = self.milvus_client.search(
+        fused_results = []
+        for query, dense_hits in zip(queries, dense_results):
+            sparse_ids = [id for id, _ in self.sparse_index.search(query, limit)]
+            fused_results.append(self._fuse(dense_hits, sparse_ids, limit))
+
+        # Sections found only by the lexical index still need their payload from the collection.
+        known = {hit.id: hit for hits in dense_results for hit in hits}
+        missing = list({id for fused in fused_results for id, _ in fused if id not in known})
+        if missing and self.text_store is not None:
+            known.update((id, Hit(id=id, score=0.0, store=self.text_store)) for id in missing)
+        elif missing:
+            rows = self.milvus_client.get(
+                collection_name=self.collection_name, ids=missing, output_fields=["text", "name"]
+            )
+            for row in rows:
+                known[row["id"]] = Hit(id=row["id"], score=0.0, name=row["name"], text=row["text"])
+        return [[replace(known[id], score=score) for id, score in fused if id in known] for fused in fused_results]
+
+    def _fuse(self, dense_hits: list[Hit], sparse_ids: list[int], limit: int) -> list[tuple[int, float]]:
+        scores: dict[int, float] = {}
+        for ranking in ([hit.id for hit in dense_hits], sparse_ids):
+            for rank, id in enumerate(ranking, start=1):
+                scores[id] = scores.get(id, 0.0) + 1.0 / (self.rrf_k + rank)
+        return heapq.nlargest(limit, scores.items(), key=lambda x: x[1])
+
+    def _search(self, vectors: list, limit: int) -> list[list[Hit]]:
+        keys = [_vector_digest(vector) for vector in vectors]
+        results: list[list[Hit]] = []
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.result_cache.get(key)
+            # A result fetched at a larger limit already holds the top hits for any smaller one.
+            if cached is not None and cached[0] >= limit:
+                results.append(cached[1][:limit])
+            else:
+                results.append([])
+                missing.append(i)
+
+        if missing:
+            shortlist = limit * self.rescore_multiplier
+            fresh = self.milvus_client.search(
                 collection_name=self.collection_name,
-                data=[vector_prompt],
-                search_params={"metric_type": "COSINE"},
-                output_fields=["text", "name"],
-                limit=search_width,
+                data=[quantize_vector(vectors[i], self.vector_dtype) for i in missing],
+                anns_field="vector",
+                search_params=self._search_params(shortlist),
+                output_fields=self.output_fields,
+                limit=shortlist,
             )
+            for i, hits in zip(missing, fresh):
+                results[i] = [self._to_hit(hit) for hit in hits]
+                if self.vector_dtype != "float32":
+                    results[i] = self._rescore(vectors[i], results[i], limit)
+                self.result_cache.put(keys[i], (limit, results[i]))
+        return results
 
-            return query_vector, json.dumps(query_vector)
-        except Exception as e:
-            logger.error(f"Error during vector search: {e}")
-            raise
+    def _to_hit(self, hit: dict) -> Hit:
+        if self.text_store is not None:
+            return Hit(id=hit["id"], score=hit["distance"], store=self.text_store)
+        return Hit(id=hit["id"], score=hit["distance"], name=hit["entity"]["name"], text=hit["entity"]["text"])
+
+    def _rescore(self, vector, hits: list[Hit], limit: int) -> list[Hit]:
+        if not hits:
+            return hits
+        hits = resolve_payloads(hits)
+        # Section embeddings come from the embedding cache, which is required for reduced-precision vectors, so
+        # the model only runs for sections indexed before the cache was filled.
+        section_vectors = self.embedding_model.encode([hit.text for hit in hits])
+        query = np.asarray(vector, dtype=np.float32)
+        scores = (
+            section_vectors @ query / np.maximum(np.linalg.norm(section_vectors, axis=1) * np.linalg.norm(query), 1e-12)
+        )
+        order = np.argsort(-scores)[:limit]
+        return [replace(hits[i], score=float(scores[i])) for i in order]
 
-    def create_collection_from_documents(self, documents: list[list[dict[str, str]]], drop_existing: bool = False):
+    def _search_params(self, limit: int) -> dict:
+        params = dict(self.index_profile.search_params)
+        # HNSW and DiskANN reject a candidate list shorter than the number of requested hits.
+        for key in ("ef", "search_list"):
+            if key in params:
+                params[key] = max(params[key], limit)
+        return {"metric_type": self.metric_type, "params": params}
+
+    def create_collection_from_documents(
+        self,
+        documents: list[list[dict[str, str]]],
+        drop_existing: bool = False,
+        chunk_size: int = 2048,
+    ):
         try:
             if drop_existing:
                 logger.info("Dropping existing collection")
-                self.milvus_client.drop_collection(self.collection_name)
-            logger.info("Calculating embeddings")
-            docs_with_embeddings = self.embedding_model(documents)
-            vector_size = docs_with_embeddings[0][0]["vector"].shape[0]
-            self.create_collection(vector_size)
-            self.insert_vectors(docs_with_embeddings)
+                self.drop_collection()
+            self.create_collection(self.embedding_model.dimension)
+            logger.info("Streaming embeddings into the collection")
+            self.insert_vectors(self.embedding_model.embed_stream(_iter_sections(documents), chunk_size))
             logger.info("Database population completed")
         except Exception as e:
             logger.error(f"Error populating database: {e}")
             raise
 
     def create_collection(self, vector_size: int):
+        if self.vector_dtype == "binary" and vector_size % 8:
+            raise ValueError(f"Binary vectors need a dimension divisible by 8, got {vector_size}")
         if not self.collection_exists():
             logger.info("Creating collection")
             collection_schema = pym.CollectionSchema(
@@ -60,17 +258,23 @@ class VectorDB:
                     ),
                     pym.FieldSchema(
                         name="vector",
-                        dtype=pym.DataType.FLOAT_VECTOR,
+                        dtype=VECTOR_DTYPES[self.vector_dtype],
                         dim=vector_size,
                     ),
-                    pym.FieldSchema(name="text", dtype=pym.DataType.VARCHAR, max_length=int(1e4)),
-                    pym.FieldSchema(name="name", dtype=pym.DataType.VARCHAR, max_length=int(3e3)),
                 ],
                 description="laws",
             )
+            if self.text_store is None:
+                collection_schema.add_field("text", pym.DataType.VARCHAR, max_length=int(1e4))
+                collection_schema.add_field("name", pym.DataType.VARCHAR, max_length=int(3e3))
             index_params = self.milvus_client.prepare_index_params()
             index_params.add_index(field_name="id", index_type="AUTOINDEX")
-            index_params.add_index(field_name="vector", index_type="AUTOINDEX", metric_type="COSINE")
+            index_params.add_index(
+                field_name="vector",
+                index_type=self.index_profile.index_type,
+                metric_type=self.metric_type,
+                params=self.index_profile.build_params(vector_size),
+            )
             self.milvus_client.create_collection(
                 collection_name=self.collection_name,
                 dimension=vector_size,
@@ -84,22 +288,166 @@ class VectorDB:
     def collection_exists(self) -> bool:
         return self.milvus_client.has_collection(self.collection_name)
 
-    def insert_vectors(self, docs_with_embeddings: list[list[dict[str, str]]], batch_size: int = 500):
-        data = []
-        id = 0
-        for law in docs_with_embeddings:
-            for section in law:
-                data.append(
-                    {
-                        "id": id,
-                        "vector": section["vector"],
-                        "text": section["text"],
-                        "name": section["name"],
-                    }
-                )
-                id += 1
-
-        for i in range(0, len(data), batch_size):
-            batch = data[i : i + batch_size]
-            self.milvus_client.insert(collection_name=self.collection_name, data=batch, progress_bar=True)
-            logger.info(f"Inserted batch {i // batch_size + 1}, size: {len(batch)}")
+    def drop_collection(self):
+        self.milvus_client.drop_collection(self.collection_name)
+        self.result_cache.clear()
+        if self.sparse_index is not None:
+            self.sparse_index.clear()
+        if self.text_store is not None:
+            self.text_store.clear()
+
+    def sync_collection_from_documents(self, documents: list[list[dict[str, str]]], chunk_size: int = 2048):
+        if not self.collection_exists():
+            self.create_collection_from_documents(documents, chunk_size=chunk_size)
+            return
+
+        try:
+            existing_ids = self.existing_ids()
+            sections = list(_iter_sections(documents))
+            current_ids = {section["id"] for section in sections}
+            stale_ids = list(existing_ids - current_ids)
+            new_sections = [section for section in sections if section["id"] not in existing_ids]
+            logger.info(
+                f"Syncing collection: {len(new_sections)} new, {len(stale_ids)} stale, "
+                f"{len(current_ids) - len(new_sections)} unchanged sections"
+            )
+
+            for batch in batched(stale_ids, 1000):
+                self.milvus_client.delete(collection_name=self.collection_name, ids=batch)
+            if stale_ids:
+                self.result_cache.clear()
+            for side_index in (self.sparse_index, self.text_store):
+                if side_index is not None:
+                    self._sync_side_index(side_index, sections, existing_ids)
+            if new_sections:
+                self.insert_vectors(self.embedding_model.embed_stream(new_sections, chunk_size))
+            logger.info("Collection sync completed")
+        except Exception as e:
+            logger.error(f"Error syncing database: {e}")
+            raise
+
+    def _sync_side_index(self, side_index: BM25Index | TextStore, sections: list[dict], existing_ids: set[int]):
+        # New sections are indexed as they are inserted; this covers stale entries and sections that were
+        # already in the collection before the side index existed.
+        indexed_ids = side_index.ids()
+        current_ids = {section["id"] for section in sections}
+        side_index.remove_many(list(indexed_ids - current_ids))
+        side_index.add_many(
+            section for section in sections if section["id"] in existing_ids and section["id"] not in indexed_ids
+        )
+
+    def existing_ids(self, batch_size: int = 10000) -> set[int]:
+        iterator = self.milvus_client.query_iterator(
+            collection_name=self.collection_name,
+            batch_size=batch_size,
+            filter="",
+            output_fields=["id"],
+        )
+        ids = set()
+        try:
+            while batch := iterator.next():
+                ids.update(row["id"] for row in batch)
+        finally:
+            iterator.close()
+        return ids
+
+    def insert_vectors(self, docs_with_embeddings: Iterable[list[dict]], batch_size: int = 500):
+        # A single insert thread lets the caller embed the next chunk while the previous batch is in flight;
+        # waiting on it before submitting the next one keeps at most one batch buffered.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = None
+            for batch_number, batch in enumerate(batched(_iter_rows(docs_with_embeddings), batch_size), start=1):
+                if pending is not None:
+                    pending.result()
+                pending = executor.submit(self._insert_batch, batch, batch_number)
+            if pending is not None:
+                pending.result()
+
+    def _insert_batch(self, batch: list[dict], batch_number: int):
+        rows = batch
+        if self.text_store is not None:
+            # Payloads are stored before their vectors become searchable, so every hit can be resolved.
+            self.text_store.add_many(batch)
+            rows = [{"id": row["id"], "vector": row["vector"]} for row in rows]
+        if self.vector_dtype != "float32":
+            rows = [row | {"vector": quantize_vector(row["vector"], self.vector_dtype)} for row in rows]
+        self.milvus_client.insert(collection_name=self.collection_name, data=rows, progress_bar=True)
+        if self.sparse_index is not None:
+            self.sparse_index.add_many(batch)
+        self.result_cache.clear()
+        logger.info(f"Inserted batch {batch_number}, size: {len(batch)}")
+
+
+def create_vector_client(settings: Settings) -> pym.MilvusClient | LocalVectorStore:
+    if settings.vector_backend == "local":
+        return LocalVectorStore(settings.local_vector_store_dir)
+    return pym.MilvusClient(uri=settings.milvus_uri, token=settings.milvus_token)
+
+
+def resolve_payloads(hits: list[Hit]) -> list[Hit]:
+    """Fill in the name and text of lazily fetched hits with one side store lookup per store."""
+    pending: dict[TextStore, list[int]] = {}
+    for hit in hits:
+        if hit.store is not None:
+            pending.setdefault(hit.store, []).append(hit.id)
+    if not pending:
+        return hits
+    payloads = {}
+    for store, ids in pending.items():
+        payloads.update(store.get_many(ids))
+    resolved = []
+    for hit in hits:
+        if hit.store is not None:
+            # A section removed from the store since the search gets an empty payload rather than being dropped,
+            # so the hits stay aligned with any scores computed for them.
+            name, text = payloads.get(hit.id, ("", ""))
+            hit = replace(hit, name=name, text=text, store=None)
+        resolved.append(hit)
+    return resolved
+
+
+def quantize_vector(vector, vector_dtype: str):
+    """Convert a float32 embedding to the wire format Milvus expects for the given vector field type."""
+    if vector_dtype == "float32":
+        return vector
+    vector = np.asarray(vector, dtype=np.float32)
+    if vector_dtype == "float16":
+        return vector.astype(np.float16).tobytes()
+    if vector_dtype == "bfloat16":
+        # bfloat16 is the upper half of a float32; add half an ulp (ties to even) before truncating.
+        bits = vector.view(np.uint32)
+        return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16).tobytes()
+    if vector_dtype == "binary":
+        return np.packbits(vector > 0).tobytes()
+    raise ValueError(f"Unknown vector dtype: {vector_dtype}")
+
+
+def _vector_digest(vector) -> bytes:
+    return hashlib.blake2b(np.asarray(vector, dtype=np.float32).tobytes(), digest_size=16).digest()
+
+
+def section_id(name: str, text: str) -> int:
+    # Stable across rescrapes, so an unchanged section keeps its primary key and is never re-embedded.
+    digest = hashlib.blake2b(f"{name}\x00{text}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _iter_sections(documents: list[list[dict[str, str]]]) -> Iterator[dict]:
+    seen = set()
+    for law in documents:
+        for section in law:
+            id = section_id(section["name"], section["text"])
+            if id not in seen:
+                seen.add(id)
+                yield section | {"id": id}
+
+
+def _iter_rows(docs_with_embeddings: Iterable[list[dict]]) -> Iterator[dict]:
+    for law in docs_with_embeddings:
+        for section in law:
+            yield {
+                "id": section["id"] if "id" in section else section_id(section["name"], section["text"]),
+                "vector": section["vector"],
+                "text": section["text"],
+                "name": section["name"],
+            }
@@ -0,0 +1,86 @@
+import multiprocessing as mp
+import sys
+
+import numpy as np
+import pytest
+
+from cache import EmbeddingCache, text_digest
+
+DIMENSION = 4
+
+
+def vectors_for(*values: float) -> np.ndarray:
+    return np.repeat(np.asarray(values, dtype=np.float32)[:, None], DIMENSION, axis=1)
+
+
+def test_round_trip_survives_reopen(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "org/model", DIMENSION)
+    cache.put_many([text_digest("a"), text_digest("b")], vectors_for(1, 2))
+
+    reopened = EmbeddingCache(str(tmp_path), "org/model", DIMENSION)
+    vectors, missing = reopened.get_many([text_digest("b"), text_digest("c"), text_digest("a")])
+
+    assert missing == [1]
+    np.testing.assert_array_equal(vectors[[0, 2]], vectors_for(2, 1))
+
+
+def test_duplicate_digests_are_stored_once(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIMENSION)
+    cache.put_many([text_digest("a"), text_digest("a")], vectors_for(1, 1))
+    cache.put_many([text_digest("a")], vectors_for(5))
+
+    assert len(cache) == 1
+    np.testing.assert_array_equal(cache.get_many([text_digest("a")])[0], vectors_for(1))
+
+
+def test_interrupted_append_is_trimmed(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIMENSION)
+    cache.put_many([text_digest("a")], vectors_for(1))
+    # A vector written without its key, as left by a crash between the two writes.
+    with open(cache.path / "vectors.f32", "ab") as f:
+        f.write(vectors_for(9).tobytes())
+
+    reopened = EmbeddingCache(str(tmp_path), "model", DIMENSION)
+    reopened.put_many([text_digest("b")], vectors_for(2))
+
+    vectors, missing = EmbeddingCache(str(tmp_path), "model", DIMENSION).get_many([text_digest("a"), text_digest("b")])
+    assert missing == []
+    np.testing.assert_array_equal(vectors, vectors_for(1, 2))
+
+
+def test_instances_sharing_a_directory_keep_rows_aligned(tmp_path):
+    first = EmbeddingCache(str(tmp_path), "model", DIMENSION)
+    second = EmbeddingCache(str(tmp_path), "model", DIMENSION)
+    first.put_many([text_digest("x")], vectors_for(1))
+    second.put_many([text_digest("y")], vectors_for(2))
+    first.put_many([text_digest("z")], vectors_for(3))
+
+    digests = [text_digest("x"), text_digest("y"), text_digest("z")]
+    for cache in (first, second):
+        vectors, missing = cache.get_many(digests)
+        assert missing == []
+        np.testing.assert_array_equal(vectors, vectors_for(1, 2, 3))
+
+
+def _write_rows(cache_dir: str, worker: int) -> None:
+    cache = EmbeddingCache(cache_dir, "model", DIMENSION)
+    for i in range(50):
+        cache.put_many([text_digest(f"{worker}-{i}"), text_digest(f"shared-{i}")], vectors_for(worker * 1000 + i, -i))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the cache is single-writer without flock")
+def test_concurrent_processes_keep_rows_aligned(tmp_path):
+    context = mp.get_context("spawn")
+    processes = [context.Process(target=_write_rows, args=(str(tmp_path), worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    keys = [f"{worker}-{i}" for worker in range(4) for i in range(50)] + [f"shared-{i}" for i in range(50)]
+    expected = [worker * 1000 + i for worker in range(4) for i in range(50)] + [-i for i in range(50)]
+    vectors, missing = EmbeddingCache(str(tmp_path), "model", DIMENSION).get_many([text_digest(k) for k in keys])
+
+    assert missing == []
+    np.testing.assert_array_equal(vectors, vectors_for(*expected))
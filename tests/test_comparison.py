@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_community")
+
+import comparison  # noqa: E402
+from comparison import RAGComparison  # noqa: E402
+from rate_limit import limiter_wait  # noqa: E402
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+
+class FakeAssistant:
+    def __init__(self, clock: Clock, elapsed: float, queued: float) -> None:
+        self.clock = clock
+        self.elapsed = elapsed
+        self.queued = queued
+
+    async def generate_response(self, question, **kwargs):
+        # Part of the call is spent queued behind the rate limiter or backing off, as call_llm reports it.
+        limiter_wait.get()[0] += self.queued
+        self.clock.now += self.elapsed
+        return "answer"
+
+
+class FakeProgress:
+    def __init__(self) -> None:
+        self.n = 0
+
+    def update(self, n: int) -> None:
+        self.n += n
+
+
+def test_limiter_wait_is_not_counted_as_latency(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(comparison, "time", clock)
+    rag_comparison = RAGComparison.__new__(RAGComparison)
+    rag_comparison.assistant = FakeAssistant(clock, elapsed=7.0, queued=5.0)
+
+    async def fake_judge(instruction, response, reference_answer):
+        return 4, "feedback"
+
+    rag_comparison._evaluate_with_llm_as_judge = fake_judge
+    pbar = FakeProgress()
+    item = {"question": "What does the law regulate?", "answer": "Fisheries."}
+
+    async def run():
+        return await asyncio.gather(*[rag_comparison._evaluate_item(item, [], 3, pbar) for _ in range(2)])
+
+    # Each gathered item has its own counter, so neither sees the other's queueing.
+    assert asyncio.run(run()) == [(4, pytest.approx(2.0)), (4, pytest.approx(2.0))]
+    assert pbar.n == 2
@@ -0,0 +1,276 @@
+import asyncio
+import json
+
+import openai
+import pytest
+
+import evaluation
+from cache import ResponseCache
+from evaluation import (
+    EvaluationDatasetGenerator,
+    _load_checkpoint,
+    _parse_combined_critique,
+    _remove_low_scores,
+    call_llm,
+    call_llm_stream,
+)
+from rate_limit import limiter_wait
+
+QA_RESPONSE = "Factoid question: What does the law regulate?\nAnswer: Fisheries."
+CRITIQUE_RESPONSE = json.dumps(
+    {criterion: {"evaluation": "fine", "rating": 4} for criterion in ("groundedness", "relevance", "standalone")}
+)
+
+
+def write_lines(path, *lines: str) -> None:
+    path.write_text("".join(lines), encoding="utf-8")
+
+
+def test_missing_checkpoint_is_empty(tmp_path):
+    assert _load_checkpoint(str(tmp_path / "missing.jsonl")) == []
+
+
+def test_torn_last_line_is_dropped_and_cut(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    write_lines(path, '{"name": "a"}\n', "not json\n", '{"name": "b"}\n', '{"name": "c", "cont')
+
+    assert _load_checkpoint(str(path)) == [{"name": "a"}, {"name": "b"}]
+    # The next record appended after a resume must land on a line of its own.
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"name": "d"}\n')
+    assert _load_checkpoint(str(path)) == [{"name": "a"}, {"name": "b"}, {"name": "d"}]
+
+
+def test_resume_only_processes_pending_contexts(tmp_path, monkeypatch):
+    prompts = []
+
+    async def fake_call_llm(client, prompt, model_name, **kwargs):
+        prompts.append(prompt)
+        return QA_RESPONSE if "Factoid question" in prompt else CRITIQUE_RESPONSE
+
+    monkeypatch.setattr(evaluation, "call_llm", fake_call_llm)
+    contexts = [{"name": f"Law {i}", "text": f"Context {i}"} for i in range(3)]
+    checkpoint_path = tmp_path / "checkpoint.jsonl"
+    done = {"name": "Law 1", "context": "Context 1", "question": "Already asked?", "answer": "Yes"}
+    done |= {f"{criterion}_score": 5 for criterion in ("groundedness", "relevance", "standalone")}
+    write_lines(checkpoint_path, json.dumps(done) + "\n")
+
+    generator = EvaluationDatasetGenerator(None, "model", contexts, num_workers=2)
+    result = asyncio.run(generator(checkpoint_path=str(checkpoint_path)))
+
+    # One generation and one combined critique for each of the two pending contexts.
+    assert len(prompts) == 4
+    assert all("Context 1" not in prompt for prompt in prompts)
+    assert sorted(record["name"] for record in result) == ["Law 0", "Law 1", "Law 2"]
+    assert len(_load_checkpoint(str(checkpoint_path))) == 3
+
+    prompts.clear()
+    asyncio.run(generator(checkpoint_path=str(checkpoint_path)))
+    assert prompts == []
+
+
+class FakeCompletions:
+    def __init__(self, *contents: str | None) -> None:
+        self.contents = list(contents)
+
+    async def create(self, **kwargs):
+        message = type("Message", (), {"content": self.contents.pop(0)})
+        choice = type("Choice", (), {"message": message})
+        return type("Completion", (), {"choices": [choice], "usage": None})
+
+
+class FakeClient:
+    def __init__(self, *contents: str | None) -> None:
+        self.chat = type("Chat", (), {"completions": FakeCompletions(*contents)})
+
+
+def test_empty_completions_are_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    client = FakeClient("", None, "answer")
+
+    assert asyncio.run(call_llm(client, "prompt", "model", cache=cache)) == ""
+    assert asyncio.run(call_llm(client, "prompt", "model", cache=cache)) is None
+    assert asyncio.run(call_llm(client, "prompt", "model", cache=cache)) == "answer"
+    assert asyncio.run(call_llm(client, "prompt", "model", cache=cache)) == "answer"
+    assert cache.stats() == {"hits": 1, "misses": 3, "size": 1}
+
+
+def api_error(error_class: type[openai.APIStatusError], status_code: int, headers: dict[str, str] | None = None):
+    response = type("Response", (), {"request": None, "status_code": status_code, "headers": headers or {}})
+    return error_class("failed", response=response, body=None)
+
+
+class FlakyCompletions(FakeCompletions):
+    async def create(self, **kwargs):
+        if isinstance(self.contents[0], Exception):
+            raise self.contents.pop(0)
+        return await super().create(**kwargs)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+
+    async def fake_sleep(delay: float) -> None:
+        delays.append(delay)
+
+    monkeypatch.setattr(evaluation.asyncio, "sleep", fake_sleep)
+    # Take the top of every jitter range so the delays are predictable.
+    monkeypatch.setattr(evaluation.random, "uniform", lambda low, high: high)
+    return delays
+
+
+def test_call_llm_retries_throttling_and_server_errors(sleeps):
+    client = FakeClient()
+    client.chat.completions = FlakyCompletions(
+        api_error(openai.RateLimitError, 429, {"retry-after": "7"}),
+        api_error(openai.InternalServerError, 500),
+        "answer",
+    )
+
+    async def run() -> tuple[str, float]:
+        waited = [0.0]
+        limiter_wait.set(waited)
+        return await call_llm(client, "prompt", "model"), waited[0]
+
+    response, waited = asyncio.run(run())
+
+    assert response == "answer"
+    # Retry-After plus up to a second of jitter, then exponential backoff for the second attempt.
+    assert sleeps == [8.0, 2.0]
+    # Backoff counts as waiting, so it is kept out of the measured latency.
+    assert waited == 10.0
+
+
+def test_call_llm_gives_up_after_max_retries(sleeps):
+    client = FakeClient()
+    client.chat.completions = FlakyCompletions(*[api_error(openai.InternalServerError, 503) for _ in range(3)])
+
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(call_llm(client, "prompt", "model", max_retries=2))
+    assert sleeps == [1.0, 2.0]
+
+
+def test_client_errors_are_not_retried(sleeps):
+    client = FakeClient()
+    client.chat.completions = FlakyCompletions(api_error(openai.BadRequestError, 400), "answer")
+
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(call_llm(client, "prompt", "model"))
+    assert sleeps == []
+
+
+class FakeStream:
+    def __init__(self, deltas: list[str]) -> None:
+        self.deltas = deltas
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    async def __aiter__(self):
+        for delta in self.deltas:
+            choice = type("Choice", (), {"delta": type("Delta", (), {"content": delta})})
+            yield type("Chunk", (), {"choices": [choice], "usage": None})
+
+
+class FakeStreamingCompletions:
+    def __init__(self, *streams: list[str]) -> None:
+        self.streams = list(streams)
+
+    async def create(self, **kwargs):
+        assert kwargs["stream"] is True
+        return FakeStream(self.streams.pop(0))
+
+
+async def collect(stream) -> list[str]:
+    return [chunk async for chunk in stream]
+
+
+def test_streamed_chunks_are_yielded_and_cached_when_non_empty(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    client = type(
+        "Client", (), {"chat": type("Chat", (), {"completions": FakeStreamingCompletions([""], ["Hel", "lo"])})}
+    )
+
+    assert asyncio.run(collect(call_llm_stream(client, "prompt", "model", cache=cache))) == []
+    assert asyncio.run(collect(call_llm_stream(client, "prompt", "model", cache=cache))) == ["Hel", "lo"]
+    # The replay comes from the cache as one chunk; the fake has no streams left to serve.
+    assert asyncio.run(collect(call_llm_stream(client, "prompt", "model", cache=cache))) == ["Hello"]
+    assert cache.stats()["size"] == 1
+
+
+def test_combined_critique_is_parsed_leniently():
+    response = """Here you go:
+```json
+{"Groundedness": {"evaluation": "Answerable.", "rating": "4"},
+ "relevance": {"evaluation": "Useful.", "score": 5.0},
+ "standalone": {"evaluation": "Out of range.", "rating": 9}}
+```"""
+
+    assert _parse_combined_critique(response) == {"groundedness": (4, "Answerable."), "relevance": (5, "Useful.")}
+
+
+def test_unparseable_combined_critique_is_empty():
+    assert _parse_combined_critique(None) == {}
+    assert _parse_combined_critique("Total rating: 4") == {}
+    assert _parse_combined_critique('{"relevance": 5}') == {}
+    assert _parse_combined_critique("[1, 2]") == {}
+
+
+def test_low_and_missing_scores_are_removed():
+    keep = {"groundedness_score": 3, "relevance_score": 5, "standalone_score": 4}
+    low = keep | {"standalone_score": 2}
+    missing = {"groundedness_score": 5, "relevance_score": 5}
+
+    assert _remove_low_scores([keep, low, missing]) == [keep]
+    assert _remove_low_scores([keep, low], min_scores={"relevance": 5}) == [keep, low]
+
+
+def critique_generator(monkeypatch, critique_mode: str, combined_response: str, rating: int = 2):
+    prompts = []
+
+    async def fake_call_llm(client, prompt, model_name, **kwargs):
+        prompts.append(prompt)
+        if "JSON" in prompt:
+            return combined_response
+        return f"Evaluation: Judged.\nTotal rating: {rating}"
+
+    monkeypatch.setattr(evaluation, "call_llm", fake_call_llm)
+    return EvaluationDatasetGenerator(None, "model", [], critique_mode=critique_mode), prompts
+
+
+def test_partial_combined_critique_falls_back_and_stops_at_the_first_failure(monkeypatch):
+    combined = json.dumps({"groundedness": {"evaluation": "Grounded.", "rating": 5}})
+    generator, prompts = critique_generator(monkeypatch, "combined", combined)
+
+    output = asyncio.run(generator._evaluate_single_output({"question": "Q?", "context": "C"}))
+
+    # Relevance is asked first and fails, so standalone is never asked.
+    assert len(prompts) == 2
+    assert output["groundedness_score"] == 5
+    assert output["relevance_score"] == 2
+    assert "standalone_score" not in output
+
+
+def test_separate_critiques_run_concurrently(monkeypatch):
+    generator, prompts = critique_generator(monkeypatch, "separate", "", rating=4)
+    in_flight = peak = 0
+    fake_call_llm = evaluation.call_llm
+
+    async def tracking_call_llm(*args, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return await fake_call_llm(*args, **kwargs)
+
+    monkeypatch.setattr(evaluation, "call_llm", tracking_call_llm)
+    output = asyncio.run(generator._evaluate_single_output({"question": "Q?", "context": "C"}))
+
+    assert peak == 3
+    assert all("JSON" not in prompt for prompt in prompts)
+    assert [output[f"{criterion}_score"] for criterion in ("groundedness", "relevance", "standalone")] == [4, 4, 4]
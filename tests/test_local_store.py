@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+import local_store
+from local_store import LocalVectorStore
+
+DIMENSION = 4
+
+
+def row(id: int, direction: int, text: str = "") -> dict:
+    vector = np.zeros(DIMENSION, dtype=np.float32)
+    vector[direction] = 1.0
+    return {"id": id, "vector": vector.tolist(), "name": f"law {id}", "text": text or f"section {id}"}
+
+
+@pytest.fixture(params=["faiss", "numpy"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "numpy":
+        monkeypatch.setattr(local_store, "faiss", None)
+    elif local_store.faiss is None:
+        pytest.skip("faiss is not installed")
+    store = LocalVectorStore(str(tmp_path))
+    store.create_collection("laws", dimension=DIMENSION)
+    return store
+
+
+def search_ids(store: LocalVectorStore, direction: int, limit: int = 10) -> list[int]:
+    query = np.eye(DIMENSION, dtype=np.float32)[direction]
+    return [hit["id"] for hit in store.search("laws", [query], limit=limit)[0]]
+
+
+def test_search_ranks_by_cosine_similarity(store):
+    store.insert("laws", [row(1, 0), row(2, 1), {**row(3, 0), "vector": [1.0, 1.0, 0.0, 0.0]}])
+
+    hits = store.search("laws", [[2.0, 0.0, 0.0, 0.0]], limit=2, output_fields=["name"])[0]
+
+    assert [hit["id"] for hit in hits] == [1, 3]
+    assert hits[0]["distance"] == pytest.approx(1.0)
+    assert hits[1]["distance"] == pytest.approx(1 / np.sqrt(2))
+    assert hits[0]["entity"] == {"name": "law 1"}
+
+
+def test_insert_of_existing_id_replaces_the_row(store):
+    store.insert("laws", [row(1, 0, "old")])
+    store.insert("laws", [row(1, 1, "new")])
+
+    assert store.get_collection_stats("laws")["row_count"] == 1
+    assert search_ids(store, 0) == search_ids(store, 1) == [1]
+    assert store.get("laws", [1])[0]["text"] == "new"
+
+
+def test_deleted_rows_are_not_returned(store):
+    store.insert("laws", [row(1, 0), row(2, 0), row(3, 1)])
+
+    assert store.delete("laws", [2, 99])["delete_count"] == 1
+    assert search_ids(store, 0) == [1, 3]
+    assert store.get("laws", [2]) == []
+
+
+def test_rows_survive_reopening(store, tmp_path):
+    store.insert("laws", [row(1, 0), row(2, 1)])
+    store.delete("laws", [1])
+
+    reopened = LocalVectorStore(str(tmp_path))
+
+    assert reopened.get_collection_stats("laws")["row_count"] == 1
+    assert search_ids(reopened, 1) == [2]
+    iterator = reopened.query_iterator("laws", batch_size=10)
+    assert iterator.next() == [{"id": 2}]
+    assert iterator.next() == []
+
+
+def test_interrupted_insert_is_trimmed_on_load(store, tmp_path):
+    store.insert("laws", [row(1, 0)])
+    collection_path = tmp_path / "laws"
+    # Payload and id written, vector missing: the state a crash mid-insert leaves behind.
+    with open(collection_path / "payloads.jsonl", "a") as f:
+        f.write('{"name": "law 2", "text": "section 2"}\n')
+    with open(collection_path / "ids.i64", "ab") as f:
+        f.write(np.asarray([2], dtype=np.int64).tobytes())
+
+    reopened = LocalVectorStore(str(tmp_path))
+    reopened.insert("laws", [row(3, 1)])
+
+    assert sorted(hit["id"] for hit in reopened.get("laws", [1, 2, 3])) == [1, 3]
+    assert search_ids(LocalVectorStore(str(tmp_path)), 1, limit=1) == [3]
+
+
+def test_payload_fields_are_optional(store):
+    store.insert("laws", [{"id": 1, "vector": [1.0, 0.0, 0.0, 0.0]}])
+
+    assert store.search("laws", [[1.0, 0.0, 0.0, 0.0]], limit=1, output_fields=[])[0][0]["entity"] == {}
+
+
+def test_dropped_collection_is_gone(store):
+    store.insert("laws", [row(1, 0)])
+    store.drop_collection("laws")
+
+    assert not store.has_collection("laws")
+    with pytest.raises(ValueError):
+        store.search("laws", [[1.0, 0.0, 0.0, 0.0]])
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+import rate_limit
+from rate_limit import RateLimiter, TokenBucket, limiter_wait
+
+
+class Clock:
+    """Stands in for time.monotonic and asyncio.sleep, so waiting on a bucket takes no real time."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+        self._sleep = asyncio.sleep
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        self.sleeps.append(delay)
+        self.now += delay
+        await self._sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    monkeypatch.setattr(asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def test_bucket_serves_a_burst_then_waits_for_refill(clock):
+    bucket = TokenBucket(60)
+
+    asyncio.run(bucket.acquire(60))
+    assert clock.sleeps == []
+
+    asyncio.run(bucket.acquire(2))
+    assert clock.sleeps == [pytest.approx(2.0)]
+
+
+def test_oversized_request_waits_for_a_full_bucket(clock):
+    bucket = TokenBucket(60)
+    asyncio.run(bucket.acquire(60))
+
+    asyncio.run(bucket.acquire(1000))
+
+    assert sum(clock.sleeps) == pytest.approx(60.0)
+
+
+def test_adjust_refunds_and_charges(clock):
+    bucket = TokenBucket(60)
+    asyncio.run(bucket.acquire(60))
+
+    bucket.adjust(-30)
+    asyncio.run(bucket.acquire(30))
+    assert clock.sleeps == []
+
+    bucket.adjust(30)
+    asyncio.run(bucket.acquire(1))
+    assert sum(clock.sleeps) == pytest.approx(31.0)
+
+
+def test_refund_never_overfills_the_bucket(clock):
+    bucket = TokenBucket(60)
+
+    bucket.adjust(-1000)
+
+    assert bucket.level == 60
+
+
+def test_requests_per_minute_budget_holds_back_the_next_request(clock):
+    limiter = RateLimiter(requests_per_minute=2)
+
+    async def run() -> float:
+        waited = [0.0]
+        limiter_wait.set(waited)
+        for _ in range(3):
+            async with limiter.limit():
+                pass
+        return waited[0]
+
+    # Two requests fit in the burst; the third waits for half a minute's refill.
+    assert asyncio.run(run()) == pytest.approx(30.0)
+
+
+def test_recorded_usage_refunds_the_token_budget(clock):
+    async def run(actual: int) -> None:
+        limiter = RateLimiter(tokens_per_minute=1000)
+        async with limiter.limit(1000):
+            pass
+        limiter.record_tokens(1000, actual)
+        async with limiter.limit(800):
+            pass
+
+    asyncio.run(run(actual=200))
+    assert clock.sleeps == []
+
+    # Without a refund the second request has to wait for the spent tokens to come back.
+    asyncio.run(run(actual=1000))
+    assert sum(clock.sleeps) == pytest.approx(48.0)
+
+
+def test_concurrency_is_capped(clock):
+    limiter = RateLimiter(max_concurrency=2)
+    active = [0]
+    peak = [0]
+
+    async def call() -> None:
+        async with limiter.limit():
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(1)
+            active[0] -= 1
+
+    async def run() -> None:
+        await asyncio.gather(*[call() for _ in range(5)])
+
+    asyncio.run(run())
+    assert peak[0] == 2
+
+
+def test_wait_is_not_recorded_without_a_counter(clock):
+    limiter = RateLimiter(requests_per_minute=1)
+
+    async def run() -> None:
+        for _ in range(2):
+            async with limiter.limit():
+                pass
+
+    asyncio.run(run())
+    assert sum(clock.sleeps) == pytest.approx(60.0)
+    assert limiter_wait.get() is None
@@ -0,0 +1,32 @@
+import pytest
+
+from reranker_parity import compare_rankings
+
+
+def test_identical_rankings_agree_fully():
+    scores = [[0.1, 0.9, 0.5], [2.0, -1.0]]
+
+    report = compare_rankings(scores, scores, top_k=2)
+
+    assert report == {"top_2_overlap": 1.0, "top_1_agreement": 1.0, "spearman": 1.0, "max_abs_score_diff": 0.0}
+
+
+def test_reversed_ranking_is_reported():
+    report = compare_rankings([[0.1, 0.2, 0.3]], [[0.3, 0.2, 0.1]], top_k=1)
+
+    assert report["top_1_overlap"] == 0.0
+    assert report["top_1_agreement"] == 0.0
+    assert report["spearman"] == pytest.approx(-1.0)
+    assert report["max_abs_score_diff"] == pytest.approx(0.2)
+
+
+def test_queries_with_fewer_than_two_candidates_are_skipped():
+    report = compare_rankings([[0.5], [0.1, 0.9]], [[0.7], [0.2, 0.8]], top_k=1)
+
+    assert report["top_1_agreement"] == 1.0
+    assert report["max_abs_score_diff"] == pytest.approx(0.1)
+
+
+def test_nothing_to_compare_raises():
+    with pytest.raises(ValueError, match="two or more scored candidates"):
+        compare_rankings([[0.5], []], [[0.5], []])
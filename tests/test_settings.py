@@ -0,0 +1,43 @@
+import pydantic
+import pytest
+
+from settings import Settings
+
+REQUIRED = {"OPENAI_API_KEY": "key", "LLM_MODEL": "llm", "EMBEDDING_MODEL": "embedder", "CROSS_ENCODER_MODEL": "ranker"}
+
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch):
+    # No .env file in the working directory, so only the variables set here apply.
+    monkeypatch.chdir(tmp_path)
+    for key, value in REQUIRED.items():
+        monkeypatch.setenv(key, value)
+    return monkeypatch
+
+
+@pytest.mark.parametrize(
+    "key",
+    [
+        "EMBEDDING_THREADS_PER_WORKER",
+        "QUERY_CACHE_TTL",
+        "RERANK_CASCADE_MODEL",
+        "CROSS_ENCODER_WINDOW_AGGREGATION",
+        "OPENAI_BASE_URL",
+        "RERANK_CACHE_PATH",
+        "EMBEDDING_CACHE_DIR",
+    ],
+)
+def test_blank_optional_settings_are_unset(environment, key):
+    environment.setenv(key, "")
+
+    settings = Settings()
+
+    field = next(name for name, info in Settings.model_fields.items() if info.alias == key)
+    assert getattr(settings, field) is None
+
+
+def test_blank_non_optional_settings_still_fail(environment):
+    environment.setenv("EMBEDDING_WORKERS", "")
+
+    with pytest.raises(pydantic.ValidationError):
+        Settings()
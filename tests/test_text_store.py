@@ -0,0 +1,63 @@
+from text_store import TextStore
+
+
+def section(id: int, name: str, text: str) -> dict:
+    return {"id": id, "name": name, "text": text}
+
+
+def test_get_many_returns_stored_sections(tmp_path):
+    store = TextStore(str(tmp_path))
+    store.add_many([section(30, "Law B", "Artykuł 3 – zażółć"), section(-5, "Law A", "one"), section(7, "Law A", "")])
+
+    assert len(store) == 3
+    assert store.ids() == {30, -5, 7}
+    assert store.get_many([7, 30, 99, -5]) == {
+        7: ("Law A", ""),
+        30: ("Law B", "Artykuł 3 – zażółć"),
+        -5: ("Law A", "one"),
+    }
+    assert store.get_many([]) == {}
+
+
+def test_names_are_stored_once(tmp_path):
+    store = TextStore(str(tmp_path))
+    store.add_many([section(i, "Same law", f"section {i}") for i in range(100)])
+
+    assert (tmp_path / "names.json").read_text(encoding="utf-8") == '["Same law"]'
+
+
+def test_existing_ids_are_not_added_again(tmp_path):
+    store = TextStore(str(tmp_path))
+    store.add_many([section(1, "Law", "first")])
+    blob_size = (tmp_path / "texts.bin").stat().st_size
+
+    store.add_many([section(1, "Law", "second"), section(2, "Law", "other")])
+
+    assert store.get_many([1, 2]) == {1: ("Law", "first"), 2: ("Law", "other")}
+    assert (tmp_path / "texts.bin").stat().st_size == blob_size + len("other")
+
+
+def test_removed_and_cleared_sections_are_gone(tmp_path):
+    store = TextStore(str(tmp_path))
+    store.add_many([section(1, "Law", "a"), section(2, "Law", "b"), section(3, "Law", "c")])
+
+    store.remove_many([2])
+    assert store.get_many([1, 2, 3]) == {1: ("Law", "a"), 3: ("Law", "c")}
+
+    store.clear()
+    assert len(store) == 0
+    assert store.get_many([1, 3]) == {}
+    store.add_many([section(4, "Other", "d")])
+    assert store.get_many([4]) == {4: ("Other", "d")}
+
+
+def test_sections_survive_reopening(tmp_path):
+    store = TextStore(str(tmp_path))
+    store.add_many([section(2, "Law B", "two"), section(1, "Law A", "one")])
+    store.add_many([section(3, "Law A", "three")])
+    store.remove_many([2])
+
+    reopened = TextStore(str(tmp_path))
+
+    assert reopened.ids() == {1, 3}
+    assert reopened.get_many([1, 2, 3]) == {1: ("Law A", "one"), 3: ("Law A", "three")}
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from vector_db import INDEX_PROFILES, IndexProfile, VectorDB, _iter_sections, quantize_vector, section_id
+
+
+def test_section_id_is_stable_and_content_addressed():
+    id = section_id("Regulation (EU) 2024/1244", "Article 1")
+
+    assert id == section_id("Regulation (EU) 2024/1244", "Article 1")
+    assert id != section_id("Regulation (EU) 2024/1244", "Article 2")
+    assert id != section_id("Regulation (EU) 2024/1245", "Article 1")
+    # Milvus primary keys are signed 64-bit integers.
+    assert -(2**63) <= id < 2**63
+
+
+def test_section_id_separates_name_from_text():
+    assert section_id("ab", "c") != section_id("a", "bc")
+
+
+def test_iter_sections_drops_duplicates_and_assigns_ids():
+    documents = [
+        [{"name": "Law A", "text": "one"}, {"name": "Law A", "text": "two"}],
+        [{"name": "Law A", "text": "one"}],
+    ]
+
+    sections = list(_iter_sections(documents))
+
+    assert [section["text"] for section in sections] == ["one", "two"]
+    assert [section["id"] for section in sections] == [section_id("Law A", "one"), section_id("Law A", "two")]
+
+
+@pytest.mark.parametrize(("dimension", "m"), [(384, 48), (768, 96), (1024, 128), (100, 10), (7, 1)])
+def test_ivf_pq_sub_vectors_divide_the_dimension(dimension, m):
+    params = INDEX_PROFILES["ivf_pq"].build_params(dimension)
+
+    assert params["m"] == m
+    assert dimension % params["m"] == 0
+
+
+def test_explicit_ivf_pq_m_must_divide_the_dimension():
+    profile = IndexProfile("IVF_PQ", {"nlist": 16, "m": 48, "nbits": 8}, {})
+
+    assert profile.build_params(768)["m"] == 48
+    with pytest.raises(ValueError, match="m to divide"):
+        profile.build_params(1000)
+
+
+def test_other_profiles_keep_their_params():
+    assert INDEX_PROFILES["hnsw"].build_params(384) == INDEX_PROFILES["hnsw"].params
+
+
+def bfloat16_bits(values: list[float]) -> list[int]:
+    return np.frombuffer(quantize_vector(np.asarray(values, dtype=np.float32), "bfloat16"), dtype=np.uint16).tolist()
+
+
+def test_bfloat16_rounds_to_nearest_even():
+    # bfloat16 keeps 7 mantissa bits, so around 1.0 its spacing is 2**-7.
+    assert bfloat16_bits([1.0, -2.0]) == [0x3F80, 0xC000]
+    assert bfloat16_bits([1 + 2**-8]) == [0x3F80]  # halfway, rounds down to the even mantissa
+    assert bfloat16_bits([1 + 3 * 2**-8]) == [0x3F82]  # halfway, rounds up to the even mantissa
+    assert bfloat16_bits([1 + 2**-8 + 2**-12]) == [0x3F81]  # just past halfway rounds up
+
+
+def test_bfloat16_round_trip_error_is_bounded():
+    vector = np.random.default_rng(0).standard_normal(384).astype(np.float32)
+
+    bits = np.frombuffer(quantize_vector(vector, "bfloat16"), dtype=np.uint16)
+    decoded = (bits.astype(np.uint32) << 16).view(np.float32)
+
+    np.testing.assert_allclose(decoded, vector, rtol=2**-8)
+
+
+def test_float16_and_binary_wire_formats():
+    vector = np.asarray([0.5, -1.5, 2.0, -0.1, 0.0, 3.0, -2.0, 1.0, 1.0], dtype=np.float32)
+
+    float16 = np.frombuffer(quantize_vector(vector, "float16"), dtype=np.float16)
+    np.testing.assert_array_equal(float16, vector.astype(np.float16))
+    # One bit per dimension, set for positive values, packed most significant bit first.
+    assert quantize_vector(vector, "binary") == bytes([0b10100101, 0b10000000])
+    assert quantize_vector(vector, "float32") is vector
+    with pytest.raises(ValueError):
+        quantize_vector(vector, "int8")
+
+
+def test_reduced_precision_requires_the_embedding_cache():
+    class UncachedModel:
+        cache = None
+
+    with pytest.raises(ValueError, match="EMBEDDING_CACHE_DIR"):
+        VectorDB(embedding_model=UncachedModel(), milvus_client=None, vector_dtype="float16")